@@ -0,0 +1,104 @@
+"""Generated-result cache shared across workers, and coalescing of identical in-flight work."""
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+
+class ResultCache:
+    """Two-tier cache: a per-worker LRU with TTL in front of a MongoDB collection shared by all workers"""
+
+    def __init__(self, collection, max_entries: int, ttl_seconds: int):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "writes": 0}
+
+    async def get(self, key: str):
+        """Return a copy of the cached value, or None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return copy.deepcopy(value)
+            del self.entries[key]
+
+        try:
+            document = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logging.error(f"Error reading result cache: {str(e)}")
+            document = None
+
+        if document is None:
+            self.counters["misses"] += 1
+            return None
+
+        self.counters["mongo_hits"] += 1
+        # Kept only as long as the shared entry, not a fresh full TTL
+        self._remember(key, document["value"], (document["expires_at"] - datetime.utcnow()).total_seconds())
+        return copy.deepcopy(document["value"])
+
+    async def set(self, key: str, kind: str, value: dict):
+        """Store a value in both tiers"""
+        self._remember(key, copy.deepcopy(value))
+        self.counters["writes"] += 1
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "kind": kind,
+                    "value": value,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Error writing result cache: {str(e)}")
+
+    def _remember(self, key: str, value: dict, ttl_seconds: float = None):
+        self.entries[key] = (time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["mongo_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": len(self.entries),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+        }
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one shielded in-flight task; each caller gets a copy"""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]):
+        task = self.in_flight.get(key)
+        if task is None:
+            self.counters["leaders"] += 1
+            task = asyncio.create_task(func())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.counters["coalesced"] += 1
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self.in_flight.pop(key, None)
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self.in_flight)}
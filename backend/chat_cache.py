@@ -0,0 +1,123 @@
+"""Near-duplicate answer cache for chat questions.
+
+Questions are normalised and compared as word shingles, with MinHash LSH to
+find candidates.
+"""
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+# Words that don't change what a question asks. Question words (what/why/how/is/does)
+# and negations stay: "Is this O(n)?" and "What is O(n)?" are different questions.
+QUESTION_FILLER_WORDS = {"a", "an", "the", "please", "can", "could", "would", "you", "me", "tell", "explain", "this", "my", "here", "of"}
+QUESTION_CONTRACTIONS = {"what's": "what is", "whats": "what is", "how's": "how is", "it's": "it is", "isn't": "is not", "doesn't": "does not", "don't": "do not"}
+# Words two similar questions may differ by; any other difference (Python/Java, zero/negative) changes the question
+QUESTION_SOFT_WORDS = {"i", "it", "to", "for", "with", "code", "function", "program", "snippet", "exactly", "actually", "just", "really"}
+MINHASH_PRIME = (1 << 61) - 1
+
+def normalize_question(question: str) -> str:
+    """Lowercase, expand contractions, drop punctuation and filler words"""
+    words = question.lower().replace("’", "'").split()
+    words = " ".join(QUESTION_CONTRACTIONS.get(word, word) for word in words)
+    words = re.sub(r"[^a-z0-9^+*/()' ]+", " ", words).replace("'", "").split()
+    return " ".join(word for word in words if word not in QUESTION_FILLER_WORDS)
+
+def differs_only_softly(normalized: str, other: str) -> bool:
+    return set(normalized.split()) ^ set(other.split()) <= QUESTION_SOFT_WORDS
+
+def question_shingles(normalized: str) -> frozenset:
+    """Words plus adjacent word pairs, so word order counts without dominating"""
+    words = normalized.split()
+    return frozenset([*words, *(f"{first} {second}" for first, second in zip(words, words[1:]))])
+
+class ChatAnswerCache:
+    """Per-worker cache of chat answers, matched by question similarity.
+
+    Answers are grouped by a bucket key (code context hash plus skill level).
+    A question hits on an identical normalised question, or on one whose shingle
+    Jaccard similarity reaches the threshold and whose differing words are all
+    in QUESTION_SOFT_WORDS; candidates come from MinHash
+    LSH bands so lookups don't scan the bucket. Entries expire after the TTL
+    and the least recently used are evicted past max_entries.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float, bands: int, rows: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        seeded = random.Random(0)
+        self.permutations = [(seeded.randrange(1, MINHASH_PRIME), seeded.randrange(MINHASH_PRIME)) for _ in range(bands * rows)]
+        self.entries = OrderedDict()  # (bucket, normalized question) -> (expires_at, shingles, band keys, answer)
+        self.band_index = {}  # (bucket, band number, band values) -> {entry keys}
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0}
+
+    def signature(self, shingles: frozenset) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), "big") for shingle in shingles]
+        return [min((a * value + b) % MINHASH_PRIME for value in hashes) for a, b in self.permutations]
+
+    def band_keys(self, bucket: str, shingles: frozenset) -> List[tuple]:
+        signature = self.signature(shingles)
+        return [(bucket, band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def get(self, bucket: str, question: str) -> Optional[str]:
+        normalized = normalize_question(question)
+        key = (bucket, normalized)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry[3]
+
+        shingles = question_shingles(normalized)
+        if shingles:
+            candidates = set()
+            for band_key in self.band_keys(bucket, shingles):
+                candidates.update(self.band_index.get(band_key, ()))
+            best_key, best_similarity = None, self.threshold
+            for candidate in candidates:
+                expires_at, candidate_shingles, _, _ = self.entries[candidate]
+                if expires_at <= time.monotonic() or not differs_only_softly(normalized, candidate[1]):
+                    continue
+                similarity = len(shingles & candidate_shingles) / len(shingles | candidate_shingles)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = candidate, similarity
+            if best_key is not None:
+                self.entries.move_to_end(best_key)
+                self.counters["similar_hits"] += 1
+                return self.entries[best_key][3]
+
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, bucket: str, question: str, answer: str):
+        normalized = normalize_question(question)
+        key = (bucket, normalized)
+        self._remove(key)
+        shingles = question_shingles(normalized)
+        band_keys = self.band_keys(bucket, shingles) if shingles else []
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, shingles, band_keys, answer)
+        for band_key in band_keys:
+            self.band_index.setdefault(band_key, set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry[2]:
+            keys = self.band_index.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.band_index[band_key]
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self.entries)}
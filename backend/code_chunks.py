@@ -0,0 +1,111 @@
+"""Split large source files into prompt-sized chunks and compare Big-O answers across them."""
+import ast
+import re
+from typing import List, Tuple
+
+# Characters a line too long for one chunk prefers to break after, best first
+LINE_BREAK_CHARACTERS = ";, \t"
+
+# O(...) expressions inside an answer, allowing one level of nested parentheses as in O(n log(n))
+BIG_O_PATTERN = re.compile(r"o\(((?:[^()]|\([^()]*\))*)\)")
+LOG_PATTERN = re.compile(r"(?:log(?:_?\d+)?)+(?:\([a-z]\)|[a-z])")
+SQRT_PATTERN = re.compile(r"(?:sqrt\(?|√\(?)[a-z]\)?")
+POWER_PATTERN = re.compile(r"([a-z])(?:\^(\d+)|([²³]))?")
+EXPONENTIAL_PATTERN = re.compile(r"\d+\^\(?[a-z]")
+
+def top_level_boundaries(code: str) -> List[int]:
+    """0-based line numbers where top-level definitions start"""
+    lines = code.split('\n')
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        # Not Python: a new block starts at an unindented line after a blank line or a closing brace
+        return [
+            index for index, line in enumerate(lines)
+            if index > 0 and line[:1] not in ("", " ", "\t", "}", ")", "]")
+            and lines[index - 1].strip() in ("", "}", "};")
+        ]
+
+    boundaries = []
+    for node in tree.body:
+        start = min([node.lineno, *(decorator.lineno for decorator in getattr(node, "decorator_list", []))])
+        boundaries.append(start - 1)
+    return boundaries
+
+def split_long_line(line: str, max_chars: int) -> List[str]:
+    """Cut a line longer than max_chars (minified code), preferring to break after ; , or whitespace"""
+    pieces = []
+    while len(line) > max_chars:
+        breaks = (line.rfind(char, max_chars // 2, max_chars) + 1 for char in LINE_BREAK_CHARACTERS)
+        cut = next((position for position in breaks if position), max_chars)
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+def split_code_into_chunks(code: str, max_chars: int) -> List[str]:
+    """Split code at top-level function/class boundaries into chunks of at most max_chars.
+
+    Neighbouring definitions are packed together; a single definition that is
+    still too large is split by lines, and a single line that is too large by
+    characters.
+    """
+    if len(code) <= max_chars:
+        return [code]
+
+    lines = code.split('\n')
+    starts = sorted({0, *top_level_boundaries(code)})
+    segments = ['\n'.join(lines[start:end]) for start, end in zip(starts, [*starts[1:], len(lines)])]
+
+    chunks, current = [], ""
+    for segment in segments:
+        pieces = [segment]
+        if len(segment) > max_chars:
+            pieces, piece = [], ""
+            for line in segment.split('\n'):
+                *full, line = split_long_line(line, max_chars)
+                if full:
+                    pieces.extend(([piece] if piece else []) + full)
+                    piece = ""
+                if piece and len(piece) + len(line) + 1 > max_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece}\n{line}" if piece else line
+            pieces.append(piece)
+
+        for piece in pieces:
+            if current and len(current) + len(piece) + 1 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n{piece}" if current else piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def expression_rank(expression: str) -> Tuple[int, float, int]:
+    """(exponential, polynomial degree, log factors) of the costliest term of one O(...) body"""
+    if "!" in expression:
+        return (2, 0, 0)
+    if EXPONENTIAL_PATTERN.search(expression):
+        return (1, 0, 0)
+    ranks = []
+    for term in expression.split("+"):
+        logs = len(LOG_PATTERN.findall(term))
+        term = LOG_PATTERN.sub("", term)
+        degree = 0.5 * len(SQRT_PATTERN.findall(term))
+        term = SQRT_PATTERN.sub("", term)
+        # Every variable counts as the input size: O(V + E) is linear and O(n*m) quadratic
+        for match in POWER_PATTERN.finditer(term):
+            exponent = match.group(2) or {"²": "2", "³": "3"}.get(match.group(3), "1")
+            degree += int(exponent)
+        ranks.append((0, degree, logs))
+    return max(ranks)
+
+def complexity_rank(notation: str) -> Tuple[int, float, int]:
+    """Sort key for a Big-O answer, cheapest first; (-1, 0, 0) if it has no O(...) in it.
+
+    An answer naming several cases ("O(n) average, O(n^2) worst") ranks as its
+    most expensive one.
+    """
+    normalized = "".join(str(notation).lower().split()).replace("·", "").replace("log₂", "log")
+    return max((expression_rank(expression) for expression in BIG_O_PATTERN.findall(normalized)), default=(-1, 0, 0))
@@ -0,0 +1,364 @@
+"""Convert structured pseudocode into a Mermaid flowchart without calling Gemini.
+
+Understands the indented format the system prompt asks for: FUNCTION/PROCEDURE,
+IF/ELSE IF/ELSE, FOR, WHILE, REPEAT/DO ... UNTIL/WHILE, RETURN, BREAK and
+CONTINUE, with or without END markers. pseudocode_to_mermaid() returns None when
+the text doesn't fit that format, so the caller can fall back to the LLM.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Longest node label before it's truncated
+FLOWCHART_MAX_LABEL_CHARS = 80
+
+FENCE_PATTERN = re.compile(r"```([a-zA-Z]*)\s*\n(.*?)```", re.DOTALL)
+# Fence tags a pseudocode block may carry; the pseudocode stage often adds code and diagram fences too
+PSEUDOCODE_FENCE_TAGS = ("", "pseudocode", "pseudo", "text", "plaintext")
+LIST_MARKER_PATTERN = re.compile(r"^(?:\d+[.)]|[-*+])[ \t]+")
+FUNCTION_PATTERN = re.compile(r"^(?:FUNCTION|PROCEDURE|DEF|METHOD|SUBROUTINE)\s+(.+?):?$", re.IGNORECASE)
+GROUP_PATTERN = re.compile(r"^(?:BEGIN|START|MAIN|(?:ALGORITHM|PROGRAM)(?:\s+.*)?):?$", re.IGNORECASE)
+IF_PATTERN = re.compile(r"^IF\s+(.+?)(?:\s+THEN)?:?$", re.IGNORECASE)
+ELSE_IF_PATTERN = re.compile(r"^(?:ELSE\s*IF|ELIF|ELSIF)\s+(.+?)(?:\s+THEN)?:?$", re.IGNORECASE)
+ELSE_PATTERN = re.compile(r"^ELSE:?$", re.IGNORECASE)
+FOR_PATTERN = re.compile(r"^(FOR(?:\s+EACH)?\s+.+?)(?:\s+DO)?:?$", re.IGNORECASE)
+WHILE_PATTERN = re.compile(r"^WHILE\s+(.+?)(?:\s+DO)?:?$", re.IGNORECASE)
+REPEAT_PATTERN = re.compile(r"^(?:REPEAT|DO|LOOP):?$", re.IGNORECASE)
+UNTIL_PATTERN = re.compile(r"^UNTIL\s+(.+?):?$", re.IGNORECASE)
+END_PATTERN = re.compile(
+    r"^(?:END\s*(?:IF|FOR|WHILE|FUNCTION|PROCEDURE|ALGORITHM|PROGRAM|LOOP|REPEAT|DEF|METHOD|SUBROUTINE)?|NEXT(?:\s+\w+)?|STOP|DONE|})\.?$",
+    re.IGNORECASE
+)
+RETURN_PATTERN = re.compile(r"^RETURN\b", re.IGNORECASE)
+IO_PATTERN = re.compile(r"^(?:PRINT|OUTPUT|DISPLAY|WRITE|INPUT|READ|GET)\b", re.IGNORECASE)
+JUMP_PATTERN = re.compile(r"^(BREAK|CONTINUE)\b", re.IGNORECASE)
+# Header and footer lines describing the algorithm (`**Input:** An array arr`) rather than steps of it
+METADATA_PATTERN = re.compile(
+    r"^(?:INPUTS?|OUTPUTS?|ALGORITHM|PURPOSE|DESCRIPTION|PARAMETERS?|RETURNS|EXAMPLE|NOTE|"
+    r"PRE-?CONDITIONS?|POST-?CONDITIONS?|(?:(?:TIME|SPACE)\s+)?COMPLEXITY)\s*:\s*\S",
+    re.IGNORECASE
+)
+# A body on the same line as its opener (`IF x THEN RETURN 0`); DO is only a keyword in capitals
+INLINE_BODY_PATTERN = re.compile(r"(?:\b(?i:THEN)|\bDO)\s+\S")
+
+# Block kinds that never have a body
+STATEMENT_KINDS = ("statement", "io", "return", "break", "continue")
+
+class PseudocodeParseError(ValueError):
+    pass
+
+@dataclass
+class Block:
+    """One parsed statement; `kind` decides which of the fields are used"""
+    kind: str  # statement, io, return, break, continue, if, for, while, repeat, function, group
+    text: str = ""
+    body: List["Block"] = field(default_factory=list)
+    orelse: List["Block"] = field(default_factory=list)
+    repeat_while: bool = False  # repeat blocks: loop while `text` holds instead of until it does
+
+@dataclass
+class OpenBlock:
+    block: Block
+    indent: int
+    body_indent: Optional[int] = None
+    in_else: bool = False
+    closed_by_else_if: bool = False  # an ELSE IF nests an IF that its parent's END also closes
+
+    def children(self) -> List[Block]:
+        return self.block.orelse if self.in_else else self.block.body
+
+def clean_lines(pseudocode: str) -> List[Tuple[int, str]]:
+    """(indent, text) for each meaningful line, without fences, comments, Markdown or Input:/Output: headers"""
+    fences = FENCE_PATTERN.findall(pseudocode)
+    if fences:
+        pseudocode = next((body for tag, body in fences if tag.lower() in PSEUDOCODE_FENCE_TAGS), fences[0][1])
+
+    lines = []
+    for raw_line in pseudocode.expandtabs(4).split("\n"):
+        text = raw_line.strip()
+        if not text or text.startswith(("//", "#", "```")) or (text.startswith("**") and text.endswith("**")):
+            continue
+        indent = len(raw_line) - len(raw_line.lstrip())
+        marker = LIST_MARKER_PATTERN.match(text)
+        if marker:
+            # Numbered steps keep their nesting in the spacing after the number
+            indent += len(marker.group(0)) - len(marker.group(0).rstrip()) - 1
+            text = text[marker.end():]
+        text = text.split(" // ")[0].replace("**", "").strip()
+        if METADATA_PATTERN.match(text):
+            continue
+        if len(text) > 1 and text.endswith("{"):
+            text = text[:-1].rstrip()
+        if text:
+            lines.append((indent, text))
+    return lines
+
+def opener_for(text: str) -> Optional[Block]:
+    """The block a line opens, or None for a plain statement"""
+    for pattern, kind in ((FUNCTION_PATTERN, "function"), (IF_PATTERN, "if"), (WHILE_PATTERN, "while"), (FOR_PATTERN, "for")):
+        match = pattern.match(text)
+        if match:
+            if kind != "function" and INLINE_BODY_PATTERN.search(match.group(1)):
+                raise PseudocodeParseError(f"Body on the same line as {text!r}")
+            return Block(kind, match.group(1))
+    if REPEAT_PATTERN.match(text):
+        return Block("repeat")
+    if GROUP_PATTERN.match(text):
+        return Block("group", text.rstrip(":"))
+    return None
+
+def statement_for(text: str) -> Block:
+    jump = JUMP_PATTERN.match(text)
+    if jump:
+        return Block(jump.group(1).lower(), text)
+    if RETURN_PATTERN.match(text):
+        return Block("return", text)
+    if IO_PATTERN.match(text):
+        return Block("io", text)
+    return Block("statement", text)
+
+def parse_pseudocode(pseudocode: str) -> List[Block]:
+    """Parse pseudocode into a list of top-level Blocks.
+
+    Indentation and END markers are both honoured: a block whose body is
+    indented closes on dedent, and a flat block only closes on its END.
+    Raises PseudocodeParseError on structure it can't place.
+    """
+    lines = clean_lines(pseudocode)
+    if not lines:
+        raise PseudocodeParseError("No pseudocode lines")
+
+    root = OpenBlock(Block("group"), indent=-1, body_indent=lines[0][0])
+    stack = [root]
+
+    def close_dedented(indent: int, closer: bool = False):
+        """Close indented bodies that end before this line.
+
+        A body ends at the first line indented no deeper than its opener; END,
+        ELSE and UNTIL lines sit level with the opener they belong to.
+        """
+        while len(stack) > 1:
+            top = stack[-1]
+            ended = indent < top.indent if closer else indent <= top.indent
+            if top.body_indent is not None and top.body_indent > top.indent and ended:
+                stack.pop()
+            else:
+                break
+
+    def pop_to(kinds: Tuple[str, ...], indent: int) -> OpenBlock:
+        """Close blocks down to the innermost open one of `kinds`"""
+        for position in range(len(stack) - 1, 0, -1):
+            if stack[position].block.kind in kinds and stack[position].indent <= indent:
+                del stack[position + 1:]
+                return stack[position]
+        raise PseudocodeParseError(f"No open {'/'.join(kinds)} block")
+
+    brace_closed = []  # blocks the previous line closed with `}`, reopened by a following ELSE
+    for indent, text in lines:
+        reopenable, brace_closed = brace_closed, []
+        else_if = ELSE_IF_PATTERN.match(text)
+        until = UNTIL_PATTERN.match(text)
+        is_while = WHILE_PATTERN.match(text)
+        close_dedented(indent, closer=bool(END_PATTERN.match(text) or else_if or ELSE_PATTERN.match(text) or until or is_while))
+        repeat_while = is_while if stack[-1].block.kind == "repeat" and indent <= stack[-1].indent else None
+        if is_while and not repeat_while:
+            # Not the end of a DO ... WHILE, so it opens a loop like any other line
+            close_dedented(indent)
+
+        if END_PATTERN.match(text):
+            if len(stack) > 1:
+                closed = [stack.pop()]
+                # END IF after an ELSE IF chain closes the outer IF too
+                while closed[-1].closed_by_else_if and len(stack) > 1:
+                    closed.append(stack.pop())
+                if text == "}":
+                    brace_closed = closed
+            continue
+
+        if else_if or ELSE_PATTERN.match(text):
+            if reopenable and reopenable[0].block.kind == "if":
+                # `}` then `ELSE {` on the next line
+                stack.extend(reversed(reopenable))
+            open_if = pop_to(("if",), indent)
+            if open_if.in_else:
+                raise PseudocodeParseError("Branch after ELSE")
+            open_if.in_else = True
+            if else_if:
+                if INLINE_BODY_PATTERN.search(else_if.group(1)):
+                    raise PseudocodeParseError(f"Body on the same line as {text!r}")
+                nested = Block("if", else_if.group(1))
+                open_if.block.orelse.append(nested)
+                stack.append(OpenBlock(nested, open_if.indent, closed_by_else_if=True))
+            continue
+
+        if until or repeat_while:
+            open_repeat = pop_to(("repeat",), indent)
+            open_repeat.block.text = (until or repeat_while).group(1)
+            open_repeat.block.repeat_while = not until
+            stack.pop()
+            continue
+
+        parent = stack[-1]
+        if parent.body_indent is None:
+            parent.body_indent = indent
+        elif indent > parent.body_indent:
+            raise PseudocodeParseError(f"Unexpected indent at {text!r}")
+
+        block = opener_for(text) or statement_for(text)
+        parent.children().append(block)
+        if block.kind not in STATEMENT_KINDS:
+            stack.append(OpenBlock(block, indent))
+
+    # Flat blocks only close on END; one still open would swallow everything after its opener
+    for open_block in stack[1:]:
+        if open_block.body_indent == open_block.indent:
+            raise PseudocodeParseError(f"No END for {open_block.block.kind} block")
+
+    # Text beside functions that never calls them is leftover prose, not a main program
+    functions = [block.text.split("(")[0].strip() for block in root.block.body if block.kind == "function"]
+    main = " ".join(block_texts([block for block in root.block.body if block.kind != "function"]))
+    if functions and main and not any(re.search(rf"\b{re.escape(name)}\b", main) for name in functions):
+        raise PseudocodeParseError("Top-level text that doesn't call any function")
+
+    return root.block.body
+
+def block_texts(blocks: List[Block]):
+    for block in blocks:
+        yield block.text
+        yield from block_texts(block.body + block.orelse)
+
+def escape_label(text: str) -> str:
+    """Quote-safe Mermaid label text using Mermaid's #entity; escapes"""
+    if len(text) > FLOWCHART_MAX_LABEL_CHARS:
+        text = text[:FLOWCHART_MAX_LABEL_CHARS - 3].rstrip() + "..."
+    for char, entity in (("#", "#35;"), ('"', "#quot;"), ("<", "#lt;"), (">", "#gt;"), ("`", "#96;")):
+        text = text.replace(char, entity)
+    return text
+
+class MermaidBuilder:
+    """Lays Blocks out as flowchart nodes and edges.
+
+    Exits are (node id, edge label) pairs still waiting to be connected to
+    whatever comes next.
+    """
+
+    SHAPES = {
+        "terminal": '(["{}"])',
+        "statement": '["{}"]',
+        "io": '[/"{}"/]',
+        "decision": '{{"{}"}}',
+    }
+
+    def __init__(self):
+        self.lines = ["flowchart TD"]
+        self.count = 0
+        self.loops = []  # (continue target, break exits) of the enclosing loops
+        self.function_end = None
+
+    def node(self, shape: str, text: str) -> str:
+        self.count += 1
+        node_id = f"N{self.count}"
+        self.lines.append(f"    {node_id}{self.SHAPES[shape].format(escape_label(text))}")
+        return node_id
+
+    def connect(self, exits: List[Tuple[str, Optional[str]]], target: str):
+        for source, label in exits:
+            self.lines.append(f"    {source} -->|{escape_label(label)}| {target}" if label else f"    {source} --> {target}")
+
+    def chain(self, blocks: List[Block], exits):
+        for block in blocks:
+            exits = self.emit(block, exits)
+        return exits
+
+    def emit(self, block: Block, exits):
+        if block.kind in ("statement", "io"):
+            node_id = self.node(block.kind, block.text)
+            self.connect(exits, node_id)
+            return [(node_id, None)]
+
+        if block.kind == "return":
+            node_id = self.node("statement", block.text)
+            self.connect(exits, node_id)
+            if self.function_end is not None:
+                self.function_end.append((node_id, None))
+                return []
+            return [(node_id, None)]
+
+        if block.kind in ("break", "continue"):
+            if not self.loops:
+                raise PseudocodeParseError(f"{block.text} outside a loop")
+            continue_target, break_exits = self.loops[-1]
+            if block.kind == "break":
+                break_exits.extend(exits)
+            else:
+                self.connect(exits, continue_target)
+            return []
+
+        if block.kind == "group":
+            return self.chain(block.body, exits)
+
+        if block.kind == "if":
+            decision = self.node("decision", block.text)
+            self.connect(exits, decision)
+            then_exits = self.chain(block.body, [(decision, "Yes")])
+            else_exits = self.chain(block.orelse, [(decision, "No")])
+            return then_exits + else_exits
+
+        if block.kind in ("for", "while"):
+            decision = self.node("decision", block.text)
+            self.connect(exits, decision)
+            enter, leave = ("Next", "Done") if block.kind == "for" else ("Yes", "No")
+            break_exits = []
+            self.loops.append((decision, break_exits))
+            self.connect(self.chain(block.body, [(decision, enter)]), decision)
+            self.loops.pop()
+            return [(decision, leave)] + break_exits
+
+        if block.kind == "repeat":
+            if not block.text:
+                raise PseudocodeParseError("REPEAT without UNTIL")
+            if not block.body or block.body[0].kind in ("break", "continue"):
+                raise PseudocodeParseError("REPEAT block must start with a statement")
+            first = f"N{self.count + 1}"
+            condition = f"{'while' if block.repeat_while else 'until'} {block.text}"
+            break_exits = []
+            # The condition node doesn't exist yet, so CONTINUE restarts the body
+            self.loops.append((first, break_exits))
+            body_exits = self.chain(block.body, exits)
+            self.loops.pop()
+            decision = self.node("decision", condition)
+            self.connect(body_exits, decision)
+            again, leave = ("Yes", "No") if block.repeat_while else ("No", "Yes")
+            self.connect([(decision, again)], first)
+            return [(decision, leave)] + break_exits
+
+        raise PseudocodeParseError(f"Unknown block {block.kind}")
+
+    def emit_function(self, block: Block):
+        start = self.node("terminal", block.text)
+        name = block.text.split("(")[0].strip()
+        self.function_end = []
+        exits = self.chain(block.body, [(start, None)])
+        end = self.node("terminal", f"End {name}")
+        self.connect(exits + self.function_end, end)
+        self.function_end = None
+
+    def emit_program(self, blocks: List[Block]):
+        """Functions get their own start/end; everything else forms the main flow"""
+        main = [block for block in blocks if block.kind != "function"]
+        for block in blocks:
+            if block.kind == "function":
+                self.emit_function(block)
+        if main:
+            start = self.node("terminal", "Start")
+            exits = self.chain(main, [(start, None)])
+            end = self.node("terminal", "End")
+            self.connect(exits, end)
+        return "\n".join(self.lines)
+
+def pseudocode_to_mermaid(pseudocode: str) -> Optional[str]:
+    """Mermaid `flowchart TD` code for the pseudocode, or None if it can't be parsed"""
+    try:
+        return MermaidBuilder().emit_program(parse_pseudocode(pseudocode))
+    except PseudocodeParseError:
+        return None
@@ -0,0 +1,197 @@
+"""MongoDB-backed queue of background jobs, run by asyncio workers."""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+class JobQueue:
+    """Leased job queue: at-least-once delivery, retry with backoff, and release of unfinished jobs on shutdown"""
+
+    def __init__(
+        self,
+        collection,
+        execute: Callable[[dict], Awaitable[str]],
+        retry_policy: Callable[[Exception, int], Tuple[Optional[float], str]],
+        workers: int,
+        visibility_timeout: float,
+        max_attempts: int,
+        retention_seconds: float,
+        poll_interval: float
+    ):
+        self.collection = collection
+        self.execute = execute  # job request -> result id
+        self.retry_policy = retry_policy  # (error, attempts) -> (retry delay or None to fail now, error message)
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_tasks = []
+        self.running = {}  # job id -> task running it
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.counters = {"enqueued": 0, "succeeded": 0, "retried": 0, "failed": 0, "released": 0}
+
+    async def enqueue(self, request: dict) -> dict:
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        job = {
+            "_id": job_id,
+            "id": job_id,
+            "status": "queued",
+            "request": request,
+            "attempts": 0,
+            "available_at": now,
+            "lease_owner": None,
+            "result_id": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        await self.collection.insert_one(job)
+        self.counters["enqueued"] += 1
+        self.wakeup.set()
+        return job
+
+    async def claim(self) -> Optional[dict]:
+        """Lease the oldest available job, including running jobs whose lease has expired"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"status": {"$in": ["queued", "running"]}, "available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": self.owner,
+                    "available_at": now + timedelta(seconds=self.visibility_timeout),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def update_leased(self, job_id: str, update: dict) -> bool:
+        """Apply an update only while this worker still holds the job's lease"""
+        update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+        outcome = await self.collection.update_one({"_id": job_id, "status": "running", "lease_owner": self.owner}, update)
+        if not outcome.matched_count:
+            logging.warning(f"Lost the lease on job {job_id}")
+        return bool(outcome.matched_count)
+
+    def finished(self, status: str, **fields) -> dict:
+        return {"$set": {
+            "status": status,
+            "lease_owner": None,
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.retention_seconds),
+            **fields
+        }}
+
+    async def renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            await self.update_leased(job_id, {"$set": {"available_at": datetime.utcnow() + timedelta(seconds=self.visibility_timeout)}})
+
+    async def run_job(self, job: dict):
+        job_id = job["_id"]
+        if job["attempts"] > self.max_attempts:
+            # Its lease kept expiring, so the workers running it died or hung
+            self.counters["failed"] += 1
+            await self.update_leased(job_id, self.finished("failed", error=job.get("error") or "Job lease expired too many times"))
+            return
+
+        renewer = asyncio.create_task(self.renew_lease(job_id))
+        try:
+            result_id = await self.execute(job["request"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            retry_after, error = self.retry_policy(e, job["attempts"])
+
+            if retry_after is not None and job["attempts"] < self.max_attempts:
+                self.counters["retried"] += 1
+                await self.update_leased(job_id, {"$set": {
+                    "status": "queued",
+                    "lease_owner": None,
+                    "available_at": datetime.utcnow() + timedelta(seconds=retry_after),
+                    "error": error
+                }})
+            else:
+                logging.error(f"Job {job_id} failed: {error}")
+                self.counters["failed"] += 1
+                await self.update_leased(job_id, self.finished("failed", error=error))
+        else:
+            self.counters["succeeded"] += 1
+            await self.update_leased(job_id, self.finished("succeeded", result_id=result_id, error=None))
+        finally:
+            renewer.cancel()
+
+    async def release(self, job_id: str):
+        """Hand an interrupted job back to the queue without counting the attempt"""
+        self.counters["released"] += 1
+        await self.update_leased(job_id, {
+            "$set": {"status": "queued", "lease_owner": None, "available_at": datetime.utcnow()},
+            "$inc": {"attempts": -1}
+        })
+
+    async def run_worker(self):
+        while not self.stopping:
+            # Cleared before claiming so an enqueue during the claim still wakes us
+            self.wakeup.clear()
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logging.error(f"Error claiming job: {str(e)}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Run in its own task so draining can cancel the job without killing the loop mid-update
+            task = asyncio.create_task(self.run_job(job))
+            self.running[job["_id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    raise
+            except Exception as e:
+                logging.error(f"Error running job {job['_id']}: {str(e)}")
+            finally:
+                self.running.pop(job["_id"], None)
+
+    def start(self):
+        self.stopping = False
+        self.worker_tasks = [asyncio.create_task(self.run_worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float):
+        """Stop claiming, wait for running jobs up to drain_timeout, then release the rest"""
+        self.stopping = True
+        self.wakeup.set()
+        running = dict(self.running)
+        if running:
+            await asyncio.wait(list(running.values()), timeout=drain_timeout)
+
+        for job_id, task in running.items():
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                try:
+                    await self.release(job_id)
+                except Exception as e:
+                    logging.error(f"Error releasing job {job_id}: {str(e)}")
+
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    def stats(self) -> dict:
+        return {**self.counters, "workers": len(self.worker_tasks), "running": len(self.running)}
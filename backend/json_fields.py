@@ -0,0 +1,115 @@
+"""Parse and validate JSON-mode Gemini answers field by field."""
+import json
+import logging
+import re
+from typing import Awaitable, Callable
+
+# Matches a Markdown code fence around a JSON answer, with or without a language tag
+JSON_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)```", re.DOTALL)
+JSON_START_PATTERN = re.compile(r"[\[{]")
+# Start positions tried per candidate before giving up, so prose full of brackets stays cheap
+JSON_MAX_START_ATTEMPTS = 50
+
+# Per-kind outcomes of parsing JSON-mode responses, for /gemini/stats
+json_parse_counters = {}
+
+def extract_json(text: str):
+    """Parse a JSON answer, tolerating Markdown fences and text before or after it"""
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    fenced = JSON_FENCE_PATTERN.search(text)
+    candidates = [fenced.group(1).strip()] if fenced else []
+    candidates.append(text)
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        # Try each bracket in turn and keep the longest value, so "see [1] {...}" yields the object
+        best, best_length, decoded_to = None, 0, 0
+        for attempt, start in enumerate(JSON_START_PATTERN.finditer(candidate)):
+            if attempt == JSON_MAX_START_ATTEMPTS:
+                break
+            if start.start() < decoded_to:
+                continue
+            try:
+                value, end = decoder.raw_decode(candidate, start.start())
+            except ValueError:
+                continue
+            decoded_to = end
+            if end - start.start() > best_length:
+                best, best_length = value, end - start.start()
+        if best_length:
+            return best
+    raise ValueError("No JSON value found in response")
+
+def is_text(value) -> bool:
+    return isinstance(value, str) and value.strip() != ""
+
+def is_text_list(value) -> bool:
+    return isinstance(value, list) and len(value) > 0 and all(is_text(item) for item in value)
+
+def is_quality_score(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 1 <= value <= 10
+
+# Declared response fields: name -> (response schema, validator)
+ANALYSIS_FIELDS = {
+    "time_complexity": ({"type": "STRING"}, is_text),
+    "space_complexity": ({"type": "STRING"}, is_text),
+    "quality_score": ({"type": "INTEGER"}, is_quality_score),
+    "optimizations": ({"type": "ARRAY", "items": {"type": "STRING"}}, is_text_list),
+    "alternatives": ({"type": "ARRAY", "items": {"type": "STRING"}}, is_text_list),
+    "learning_insights": ({"type": "ARRAY", "items": {"type": "STRING"}}, is_text_list),
+}
+SUGGESTION_FIELDS = {
+    "suggestions": ({"type": "ARRAY", "items": {"type": "STRING"}}, is_text_list),
+}
+
+async def request_json_fields(call: Callable[[str, dict], Awaitable[str]], prompt: str, fields: dict, kind: str) -> dict:
+    """Ask for `fields` through `call(prompt, response_schema)` and return the fields that validate.
+
+    Fields that are missing or invalid are asked for once more on their own
+    rather than repeating the whole request. The result may still be partial,
+    including when that second call fails.
+    """
+    counters = json_parse_counters.setdefault(kind, {"parsed": 0, "extracted": 0, "unparseable": 0, "invalid_fields": 0, "field_retries": 0})
+    valid = {}
+    missing = list(fields)
+    for attempt in range(2):
+        if attempt:
+            counters["field_retries"] += 1
+            request_prompt = f"{prompt}\n\nRespond with a JSON object containing only these fields: {', '.join(missing)}"
+        else:
+            request_prompt = prompt
+
+        schema = {
+            "type": "OBJECT",
+            "properties": {field: fields[field][0] for field in missing},
+            "required": missing
+        }
+        try:
+            text = await call(request_prompt, schema)
+        except Exception as e:
+            if not attempt:
+                raise
+            logging.warning(f"Error retrying {kind} fields {missing}: {str(e)}")
+            break
+        try:
+            data = json.loads(text)
+            counters["parsed"] += 1
+        except ValueError:
+            try:
+                data = extract_json(text)
+                counters["extracted"] += 1
+            except ValueError:
+                data = None
+                counters["unparseable"] += 1
+
+        if isinstance(data, dict):
+            valid.update({field: data[field] for field in missing if fields[field][1](data.get(field))})
+        missing = [field for field in fields if field not in valid]
+        if not missing:
+            break
+        counters["invalid_fields"] += len(missing)
+    return valid
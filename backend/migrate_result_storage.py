@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Migrate processing_results documents to the compact header + compressed body layout.
+
+Legacy documents embed pseudocode, flowchart and code_outputs inline. This moves
+those bodies into processing_result_bodies and strips them from the header.
+It is safe to re-run: only documents without a storage_version are touched,
+and body writes are upserts.
+
+Usage (from the backend directory):
+    python migrate_result_storage.py [--batch-size 200] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import ReplaceOne, UpdateOne
+
+from server import RESULT_STORAGE_VERSION, client, db, split_result_document
+
+async def migrate(batch_size: int, dry_run: bool):
+    legacy_query = {"storage_version": {"$exists": False}}
+    total = await db.processing_results.count_documents(legacy_query)
+    logging.info(f"{total} processing_results documents use the legacy layout")
+    if dry_run or total == 0:
+        return
+
+    migrated = 0
+    while True:
+        documents = await db.processing_results.find(legacy_query).limit(batch_size).to_list(batch_size)
+        if not documents:
+            break
+
+        body_writes, header_writes = [], []
+        for document in documents:
+            document.setdefault("code_outputs", {})
+            document.setdefault("pseudocode", "")
+            document.setdefault("flowchart", "")
+            header, bodies = split_result_document(document)
+            body_writes.extend(ReplaceOne({"_id": body["_id"]}, body, upsert=True) for body in bodies)
+            header_writes.append(UpdateOne(
+                {"_id": document["_id"], "storage_version": {"$exists": False}},
+                {
+                    "$set": {"languages": header["languages"], "storage_version": RESULT_STORAGE_VERSION},
+                    "$unset": {"pseudocode": "", "flowchart": "", "code_outputs": ""}
+                }
+            ))
+
+        # Bodies first, so a migrated header never points at bodies that don't exist yet
+        await db.processing_result_bodies.bulk_write(body_writes, ordered=False)
+        await db.processing_results.bulk_write(header_writes, ordered=False)
+
+        migrated += len(documents)
+        logging.info(f"Migrated {migrated}/{total} documents")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents that need migrating")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(migrate(args.batch_size, args.dry_run))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
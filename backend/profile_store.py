@@ -0,0 +1,177 @@
+"""Per-worker cache of learner profiles with write-behind batching to MongoDB."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+class ProfileStore:
+    """Profile LRU with a short TTL; mutations apply at once and are flushed to MongoDB in periodic bulk writes"""
+
+    def __init__(self, collection, profile_type, max_entries: int, ttl_seconds: float, flush_interval: float, history_limit: int):
+        self.collection = collection
+        self.profile_type = profile_type  # pydantic model built from a profile document
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.history_limit = history_limit
+        self.profiles = OrderedDict()  # session_id -> (expires_at, profile); without interaction_history, which is never read back
+        self.pending = {}  # session_id -> {"set": {...}, "inc": {...}, "push": [...]}
+        self.flushing = {}  # the batch being written right now, same shape as pending
+        self.flush_generation = 0  # bumped when a flush starts and ends
+        self.flush_task = None
+        self.flush_write = None  # the task writing `flushing`
+        self.counters = {"hits": 0, "misses": 0, "flushes": 0, "flushed_updates": 0, "flush_errors": 0}
+
+    async def get(self, session_id: str):
+        """Return a copy of the profile, loading or creating it on a miss"""
+        entry = self.profiles.get(session_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.profiles.move_to_end(session_id)
+            self.counters["hits"] += 1
+            return entry[1].copy(deep=True)
+
+        self.counters["misses"] += 1
+        while True:
+            # A read that overlaps a flush may or may not include it, so read again
+            generation = self.flush_generation
+            profile_data = await self.collection.find_one({"session_id": session_id}, {"interaction_history": 0})
+            if generation == self.flush_generation:
+                break
+        if profile_data:
+            profile = self.profile_type(**profile_data)
+        else:
+            # Create new profile; $setOnInsert keeps concurrent first requests from clobbering each other
+            profile = self.profile_type(session_id=session_id)
+            await self.collection.update_one(
+                {"session_id": session_id},
+                {"$setOnInsert": profile.dict()},
+                upsert=True
+            )
+
+        # Writes that haven't landed yet are newer than what was just read
+        for ops in (self.flushing.get(session_id), self.pending.get(session_id)):
+            if ops:
+                self._apply(profile, ops["set"], ops["inc"])
+
+        self.profiles[session_id] = (time.monotonic() + self.ttl_seconds, profile)
+        self.profiles.move_to_end(session_id)
+        while len(self.profiles) > self.max_entries:
+            self.profiles.popitem(last=False)
+        return profile.copy(deep=True)
+
+    def update_fields(self, session_id: str, fields: dict):
+        self._queue(session_id, {"set": dict(fields), "inc": {}, "push": []})
+
+    def record_interaction(self, session_id: str, interaction: dict):
+        self._queue(session_id, {"set": {}, "inc": {"interaction_count": 1}, "push": [interaction]})
+
+    def _queue(self, session_id: str, ops: dict):
+        self._merge(self.pending.setdefault(session_id, {"set": {}, "inc": {}, "push": []}), ops)
+        entry = self.profiles.get(session_id)
+        if entry is not None:
+            self._apply(entry[1], ops["set"], ops["inc"])
+
+    @staticmethod
+    def _merge(target: dict, ops: dict):
+        target["set"].update(ops["set"])
+        for field, amount in ops["inc"].items():
+            target["inc"][field] = target["inc"].get(field, 0) + amount
+        target["push"].extend(ops["push"])
+
+    @staticmethod
+    def _apply(profile, set_fields: dict, inc: dict):
+        for field, value in set_fields.items():
+            setattr(profile, field, value)
+        for field, amount in inc.items():
+            setattr(profile, field, getattr(profile, field) + amount)
+
+    def insert_defaults(self, session_id: str, *updated_fields: str) -> dict:
+        """$setOnInsert values for a new profile, leaving out fields the same update writes"""
+        defaults = self.profile_type(session_id=session_id).dict()
+        for field in ("session_id", "last_updated", *updated_fields):
+            defaults.pop(field, None)
+        return defaults
+
+    def _update_for(self, session_id: str, ops: dict, now: datetime) -> UpdateOne:
+        update = {"$set": {**ops["set"], "last_updated": now}}
+        touched = list(ops["set"])
+        if ops["inc"]:
+            update["$inc"] = ops["inc"]
+            touched.extend(ops["inc"])
+        if ops["push"]:
+            update["$push"] = {"interaction_history": {"$each": ops["push"], "$slice": -self.history_limit}}
+            touched.append("interaction_history")
+        update["$setOnInsert"] = self.insert_defaults(session_id, *touched)
+        return UpdateOne({"session_id": session_id}, update, upsert=True)
+
+    async def flush(self):
+        """Write all queued mutations in one unordered bulk_write"""
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        self.flushing = batch
+        self.flush_generation += 1
+        # Shielded so cancelling the flusher at shutdown can't drop a batch that has left pending
+        self.flush_write = asyncio.create_task(self._write(batch))
+        await asyncio.shield(self.flush_write)
+
+    async def _write(self, batch: dict):
+        session_ids = list(batch)
+        now = datetime.utcnow()
+        requests = [self._update_for(session_id, batch[session_id], now) for session_id in session_ids]
+
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            failed = [session_ids[error["index"]] for error in e.details.get("writeErrors", [])]
+            logging.error(f"Error flushing {len(failed)} profile updates: {str(e)}")
+        except Exception as e:
+            failed = session_ids
+            logging.error(f"Error flushing profile updates: {str(e)}")
+        finally:
+            self.flushing = {}
+            self.flush_generation += 1
+            self.flush_write = None
+
+        self.counters["flushes"] += 1
+        self.counters["flushed_updates"] += len(requests) - len(failed)
+        if failed:
+            self.counters["flush_errors"] += len(failed)
+            # Requeue failed updates ahead of anything queued during the flush
+            newer, self.pending = self.pending, {session_id: batch[session_id] for session_id in failed}
+            for session_id, ops in newer.items():
+                self._merge(self.pending.setdefault(session_id, {"set": {}, "inc": {}, "push": []}), ops)
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self.flush_task = asyncio.create_task(self.run_flusher())
+
+    async def stop(self):
+        """Stop the periodic flush, let a write in progress finish, and write whatever is still queued"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        if self.flush_write:
+            await self.flush_write
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "cached_profiles": len(self.profiles),
+            "pending_sessions": len(self.pending)
+        }
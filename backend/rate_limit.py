@@ -0,0 +1,83 @@
+"""Process-wide Gemini requests/min and tokens/min budget."""
+import asyncio
+import time
+
+class QuotaExceeded(Exception):
+    """Raised when the Gemini quota budget is exhausted; surfaced as HTTP 429"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini quota exhausted, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute of budget.
+
+    The level may go negative: budget reserved by callers still waiting for it
+    is owed back before anyone else can be served.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available"""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+class GeminiRateLimiter:
+    """Process-wide requests/min and tokens/min budget shared by every Gemini call.
+
+    Each caller reserves its budget on entry and then sleeps until the buckets
+    have refilled enough to cover it, so callers are served in arrival order.
+    If that wait would exceed `max_wait_seconds` QuotaExceeded is raised
+    straight away instead, which bounds the total time any caller spends here.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_wait_seconds: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_wait_seconds = max_wait_seconds
+        self.counters = {"acquired": 0, "rejected": 0, "retries": 0, "upstream_throttled": 0}
+
+    async def acquire(self, tokens: int):
+        self.requests.refill()
+        self.tokens.refill()
+        charge = min(tokens, self.tokens.capacity)
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(charge))
+        if wait > self.max_wait_seconds:
+            self.counters["rejected"] += 1
+            raise QuotaExceeded(wait)
+        self.requests.level -= 1
+        self.tokens.level -= charge
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Hand the reservation back so callers behind this one aren't delayed for nothing
+                self.requests.level += 1
+                self.tokens.level += charge
+                raise
+        self.counters["acquired"] += 1
+
+    def reconcile(self, estimated_tokens: int, response):
+        """Charge the difference between the estimate and the tokens the call actually used"""
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None)
+        if actual:
+            self.tokens.level -= actual - estimated_tokens
+
+    def stats(self) -> dict:
+        self.requests.refill()
+        self.tokens.refill()
+        return {
+            **self.counters,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level)
+        }
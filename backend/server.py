@@ -1,17 +1,49 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Request, UploadFile, File, Form
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Union
+from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import uuid
+import time
+import copy
+import json
+import re
+import hashlib
+import zlib
+import tempfile
 from datetime import datetime
 import base64
 import asyncio
+import math
+import random
+import io
+import ast
 import google.generativeai as genai  # type: ignore[reportMissingImports]
+from google.api_core import exceptions as google_exceptions  # type: ignore[reportMissingImports]
+
+try:
+    from PIL import Image  # type: ignore[reportMissingImports]
+except ImportError:  # Pillow is optional; without it only exact image re-uploads are deduplicated
+    Image = None
+
+from flowchart import pseudocode_to_mermaid
+from rate_limit import GeminiRateLimiter, QuotaExceeded
+from chat_cache import ChatAnswerCache
+from static_analysis import analyze_python_statically
+from code_chunks import complexity_rank, split_code_into_chunks
+from json_fields import ANALYSIS_FIELDS, SUGGESTION_FIELDS, extract_json, is_text, json_parse_counters, request_json_fields
+from caching import ResultCache, SingleFlight
+from jobs import JobQueue
+from profile_store import ProfileStore
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -34,6 +66,10 @@ class ProcessingRequest(BaseModel):
     content: str
     description: Optional[str] = None
     target_language: Optional[str] = None
+    languages: Optional[List[str]] = None  # subset of PROGRAMMING_LANGUAGES keys; None generates all
+    structured: bool = False  # generate pseudocode, flowchart and code in one JSON call
+    use_cache: bool = True  # set to False to bypass cached results and regenerate
+    analysis_mode: str = "full"  # analyze-code only: 'fast' answers from local static analysis and enriches in the background
 
 class ProcessingResult(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -43,6 +79,8 @@ class ProcessingResult(BaseModel):
     flowchart: str
     code_outputs: dict
     code_analysis: dict = Field(default_factory=dict)
+    errors: dict = Field(default_factory=dict)  # stage/language -> error message
+    stage_timings: dict = Field(default_factory=dict)  # stage -> duration in ms
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 class UserProfile(BaseModel):
@@ -51,13 +89,40 @@ class UserProfile(BaseModel):
     skill_level: str = "beginner"  # beginner, intermediate, advanced
     learning_preferences: dict = Field(default_factory=dict)
     interaction_history: List[dict] = Field(default_factory=list)
+    interaction_count: int = 0
     knowledge_gaps: List[str] = Field(default_factory=list)
     completed_concepts: List[str] = Field(default_factory=list)
     last_updated: datetime = Field(default_factory=datetime.utcnow)
 
+class ProcessingResultSummary(BaseModel):
+    """ProcessingResult without the code bodies, for cheap history listings"""
+    id: str
+    session_id: str
+    input_type: str
+    pseudocode: str
+    flowchart: str
+    code_analysis: dict = Field(default_factory=dict)
+    errors: dict = Field(default_factory=dict)
+    stage_timings: dict = Field(default_factory=dict)
+    timestamp: datetime
+
 class SessionHistory(BaseModel):
     session_id: str
-    results: List[ProcessingResult]
+    results: List[Union[ProcessingResult, ProcessingResultSummary]]
+    next_cursor: Optional[str] = None  # pass back as `cursor` to fetch the next page
+
+class BatchProcessingRequest(BaseModel):
+    items: List[ProcessingRequest]
+
+class BatchItemResult(BaseModel):
+    index: int  # position in BatchProcessingRequest.items
+    status_code: int = 200
+    result: Optional[ProcessingResult] = None
+    error: Optional[str] = None
+
+class BatchProcessingResult(BaseModel):
+    results: List[BatchItemResult]
+    unique_items: int  # distinct generations after deduplicating identical items
 
 # Programming languages configuration
 PROGRAMMING_LANGUAGES = {
@@ -76,6 +141,15 @@ PROGRAMMING_LANGUAGES = {
 # Initialize Gemini API
 genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
 
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'  # Using stable model with better quota limits
+
+# Bump whenever a prompt changes so cached results from older prompts are not reused
+PROMPT_VERSION = "1"
+
+# Maximum number of Gemini calls in flight at once across all requests
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '10'))
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
 SYSTEM_MESSAGE = """You are an expert programming assistant that converts any input into pseudocode, flowcharts, and multiple programming languages.
 
 When given any input (text description, code, image, or audio transcript), you should:
@@ -90,85 +164,493 @@ For code, write clean, well-commented, production-ready code.
 
 Always be thorough and accurate in your conversions."""
 
-async def get_gemini_model():
-    """Get Gemini model instance"""
-    # Configure API key if not already configured
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if api_key:
-        genai.configure(api_key=api_key)
+# Model instances are stateless between calls, so one per configuration is shared by all requests
+gemini_models = {}
+
+async def get_gemini_model(model_name: str = GEMINI_MODEL_NAME, system_instruction: str = SYSTEM_MESSAGE):
+    """Get a cached Gemini model instance for this model name and system instruction"""
+    key = (model_name, system_instruction)
+    if key not in gemini_models:
+        gemini_models[key] = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=system_instruction
+        )
+    return gemini_models[key]
+
+class GeminiExecutor:
+    """Thread pool for blocking Gemini SDK calls, kept apart from the default executor"""
     
-    return genai.GenerativeModel(
-        model_name='gemini-1.5-flash',  # Using stable model with better quota limits
-        system_instruction=SYSTEM_MESSAGE
-    )
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+    
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the pool and await its result"""
+        submitted = time.perf_counter()
+        with self.lock:
+            self.queued += 1
+        
+        def call():
+            started = time.perf_counter()
+            with self.lock:
+                self.queued -= 1
+                self.active += 1
+                self.queue_wait_seconds += started - submitted
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                with self.lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - started
+            return result
+        
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+    
+    def stats(self) -> dict:
+        with self.lock:
+            uptime = time.monotonic() - self.started_at
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "utilisation": round(self.active / self.max_workers, 3),
+                "average_utilisation": round(self.busy_seconds / (uptime * self.max_workers), 3) if uptime else 0.0,
+                "average_queue_wait_ms": round(self.queue_wait_seconds / self.completed * 1000, 1) if self.completed else 0.0
+            }
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+GEMINI_EXECUTOR_WORKERS = int(os.environ.get('GEMINI_EXECUTOR_WORKERS', '16'))
+gemini_executor = GeminiExecutor(GEMINI_EXECUTOR_WORKERS)
+
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', '60'))
+GEMINI_TOKENS_PER_MINUTE = int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', '1000000'))
+GEMINI_QUOTA_MAX_WAIT_SECONDS = float(os.environ.get('GEMINI_QUOTA_MAX_WAIT_SECONDS', '30'))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '4'))
+GEMINI_RETRY_BASE_SECONDS = float(os.environ.get('GEMINI_RETRY_BASE_SECONDS', '1'))
+GEMINI_RETRY_MAX_SECONDS = float(os.environ.get('GEMINI_RETRY_MAX_SECONDS', '30'))
+
+gemini_rate_limiter = GeminiRateLimiter(GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, GEMINI_QUOTA_MAX_WAIT_SECONDS)
+
+# Errors that mean "slow down and try again" rather than a broken request
+RETRYABLE_GEMINI_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+# Gemini bills each inline image as a fixed number of tokens
+IMAGE_PART_TOKENS = 258
+
+def estimate_tokens(prompt) -> int:
+    """Rough prompt size in tokens (~4 characters each), used to reserve token budget up front.
+
+    Accepts a string, a list of parts (dicts being inline images) or a list of
+    chat contents ({"role", "parts"}).
+    """
+    parts = prompt if isinstance(prompt, list) else [prompt]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, dict) and "parts" in part:
+            tokens += estimate_tokens(part["parts"])
+        else:
+            tokens += IMAGE_PART_TOKENS if isinstance(part, dict) else len(str(part)) // 4
+    return max(1, tokens)
+
+# Use the SDK's native async API when available; set to false to force the thread pool path
+GEMINI_ASYNC_CLIENT = os.environ.get('GEMINI_ASYNC_CLIENT', 'true').lower() == 'true'
+
+def use_async_client(model) -> bool:
+    return GEMINI_ASYNC_CLIENT and hasattr(model, "generate_content_async")
+
+async def request_generation(model, prompt, estimated_tokens: int, **kwargs):
+    """Start a Gemini call through the shared rate limiter, retrying throttled calls with jittered exponential backoff.
+
+    Uses the native async API so no thread is tied up per request, falling back to the Gemini thread pool.
+    With stream=True the SDK fetches the first chunk before returning, so throttling at start-up is retried here too.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await gemini_rate_limiter.acquire(estimated_tokens)
+        try:
+            if use_async_client(model):
+                return await model.generate_content_async(prompt, **kwargs)
+            return await gemini_executor.run(model.generate_content, prompt, **kwargs)
+        except RETRYABLE_GEMINI_ERRORS as e:
+            gemini_rate_limiter.counters["upstream_throttled"] += 1
+            delay = random.uniform(0, min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt))
+            if attempt == GEMINI_MAX_RETRIES:
+                logging.error(f"Gemini still throttled after {attempt + 1} attempts: {str(e)}")
+                raise QuotaExceeded(max(delay, GEMINI_RETRY_BASE_SECONDS))
+            gemini_rate_limiter.counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+async def generate_content(model, prompt, **kwargs):
+    """Call Gemini under the shared concurrency bound with rate limiting and retries, then charge the tokens it actually used"""
+    estimated_tokens = estimate_tokens(prompt)
+    async with gemini_semaphore:
+        response = await request_generation(model, prompt, estimated_tokens, **kwargs)
+    gemini_rate_limiter.reconcile(estimated_tokens, response)
+    return response
+
+async def generate_text(model, prompt, **kwargs) -> str:
+    """Text of a single Gemini generation"""
+    response = await generate_content(model, prompt, **kwargs)
+    return response.text
+
+async def stream_text(model, prompt, on_chunk: Callable[[str], None]) -> str:
+    """Stream a Gemini generation, calling on_chunk on the event loop for each piece of text.
+
+    Start-up goes through the same rate limiting and retries as generate_content.
+    Once chunks have been sent the call can't be retried, so throttling part way
+    through is surfaced as QuotaExceeded.
+    """
+    estimated_tokens = estimate_tokens(prompt)
+    async with gemini_semaphore:
+        response = await request_generation(model, prompt, estimated_tokens, stream=True)
+        try:
+            if use_async_client(model):
+                parts = []
+                async for chunk in response:
+                    parts.append(chunk.text)
+                    on_chunk(chunk.text)
+                text = "".join(parts)
+            else:
+                text = await consume_stream(response, on_chunk)
+        except RETRYABLE_GEMINI_ERRORS as e:
+            gemini_rate_limiter.counters["upstream_throttled"] += 1
+            logging.error(f"Gemini throttled mid-stream: {str(e)}")
+            raise QuotaExceeded(GEMINI_RETRY_BASE_SECONDS)
+    gemini_rate_limiter.reconcile(estimated_tokens, response)
+    return text
 
-async def process_with_gemini(session_id: str, content: str, input_type: str, description: str = None, target_language: str = None):
-    """Process multimodal input and generate pseudocode, flowchart, and code"""
+async def consume_stream(response, on_chunk: Callable[[str], None]) -> str:
+    """Read a blocking streamed response on the Gemini thread pool, handing chunks back to the event loop"""
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+    
+    def consume():
+        parts = []
+        for chunk in response:
+            if stop.is_set():
+                break
+            parts.append(chunk.text)
+            loop.call_soon_threadsafe(on_chunk, chunk.text)
+        return "".join(parts)
+    
     try:
-        model = await get_gemini_model()
+        return await gemini_executor.run(consume)
+    finally:
+        # A cancelled caller can't interrupt the thread, but it stops reading at the next chunk
+        stop.set()
+
+@dataclass
+class PipelineStage:
+    """A unit of work in the /process pipeline"""
+    name: str
+    run: Callable[[dict], Awaitable[Any]]
+    requires: Tuple[str, ...] = ()  # stages whose output it needs; skipped if any failed
+    after: Tuple[str, ...] = ()  # stages it waits for but can run without
+
+async def run_pipeline(stages: List[PipelineStage], on_stage_complete: Callable[[str, Any, Optional[str]], None] = None):
+    """Run stages as soon as their dependencies settle.
+
+    Returns (results, errors, timings) keyed by stage name, timings in ms. Errors
+    hold the raised exception, or a message for stages skipped because a
+    required stage failed.
+    `on_stage_complete(name, result, error)` is called as each stage settles.
+    """
+    results, errors, timings = {}, {}, {}
+    tasks = {}
+    
+    async def run_stage(stage: PipelineStage):
+        dependencies = [tasks[name] for name in (*stage.requires, *stage.after)]
+        if dependencies:
+            await asyncio.wait(dependencies)
         
-        # Generate pseudocode
-        if input_type == "code":
-            if target_language:
-                pseudocode_prompt = f"Convert this code to {target_language}. Only return the converted code, no explanations:\n\n{content}"
-            else:
-                pseudocode_prompt = f"Analyze this code and create pseudocode, flowchart, and equivalent implementations:\n\n{content}"
-        elif input_type == "text":
-            pseudocode_prompt = f"Convert this text description into pseudocode, flowchart, and code:\n\n{content}"
-        elif input_type == "image":
-            pseudocode_prompt = f"Analyze this image (which contains {description or 'programming-related content'}) and convert it into pseudocode, flowchart, and code:\n\nImage data: {content}"
-        elif input_type == "audio":
-            pseudocode_prompt = f"Based on this audio transcript: '{content}', create pseudocode, flowchart, and code implementation."
+        missing = [name for name in stage.requires if name not in results]
+        if missing:
+            errors[stage.name] = f"Skipped: {', '.join(missing)} unavailable"
         else:
-            pseudocode_prompt = f"Process this input and create pseudocode, flowchart, and code:\n\n{content}"
-        
-        prompt = f"{pseudocode_prompt}\n\nPlease provide ONLY the pseudocode in a clear, structured format. Use proper indentation and clear logic flow."
-        response = await asyncio.to_thread(model.generate_content, prompt)
-        pseudocode_response = response.text
-        
-        # If target_language specified for code translation, return early with just that language
-        if input_type == "code" and target_language:
-            # Direct translation without pseudocode generation
-            translate_prompt = f"Convert this code directly to {target_language}. Return only clean, working {target_language} code:\n\n{content}"
-            response = await asyncio.to_thread(model.generate_content, translate_prompt)
-            translated_code = response.text
-            
-            return {
-                "pseudocode": translated_code,  # Contains the translated code
-                "flowchart": "",
-                "code_outputs": {target_language: translated_code}
+            started = time.perf_counter()
+            try:
+                results[stage.name] = await stage.run(results)
+            except Exception as e:
+                logging.error(f"Pipeline stage {stage.name} failed: {str(e)}")
+                errors[stage.name] = e
+            finally:
+                timings[stage.name] = round((time.perf_counter() - started) * 1000, 1)
+        
+        if on_stage_complete:
+            error = errors.get(stage.name)
+            on_stage_complete(stage.name, results.get(stage.name), str(error) if error is not None else None)
+    
+    # All tasks are created before any of them runs, so lookups in run_stage are safe
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(run_stage(stage))
+    await asyncio.gather(*tasks.values())
+    
+    return results, errors, timings
+
+def describe_input(content: str, input_type: str, description: str = None) -> str:
+    """Build the part of a prompt that presents the user's input"""
+    if input_type == "code":
+        pseudocode_prompt = f"Analyze this code and create pseudocode, flowchart, and equivalent implementations:\n\n{content}"
+    elif input_type == "text":
+        pseudocode_prompt = f"Convert this text description into pseudocode, flowchart, and code:\n\n{content}"
+    elif input_type == "image":
+        pseudocode_prompt = f"Analyze the attached image (which contains {description or 'programming-related content'}) and convert it into pseudocode, flowchart, and code."
+    elif input_type == "audio":
+        pseudocode_prompt = f"Based on this audio transcript: '{content}', create pseudocode, flowchart, and code implementation."
+    else:
+        pseudocode_prompt = f"Process this input and create pseudocode, flowchart, and code:\n\n{content}"
+    
+    return pseudocode_prompt
+
+def with_image(prompt: str, image: dict = None):
+    """Attach an image as an inline binary part ahead of the text prompt"""
+    return [image, prompt] if image else prompt
+
+def build_pseudocode_prompt(content: str, input_type: str, description: str = None, image: dict = None):
+    """Build the prompt that turns any input into structured pseudocode"""
+    prompt = f"{describe_input(content, input_type, description)}\n\nPlease provide ONLY the pseudocode in a clear, structured format. Use proper indentation and clear logic flow."
+    return with_image(prompt, image)
+
+def build_code_prompt(lang_name: str, pseudocode: str) -> str:
+    """Build the prompt that converts pseudocode to one programming language"""
+    return f"Convert this pseudocode to {lang_name}:\n\n{pseudocode}\n\nProvide ONLY the {lang_name} code, clean and well-commented."
+
+def requested_language_keys(languages: List[str] = None) -> List[str]:
+    """Keys of PROGRAMMING_LANGUAGES to generate, in their canonical order"""
+    return [lang_key for lang_key in PROGRAMMING_LANGUAGES if languages is None or lang_key in languages]
+
+def build_structured_schema(lang_keys: List[str]) -> dict:
+    """Response schema for single-call structured generation"""
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "pseudocode": {"type": "STRING"},
+            "flowchart": {"type": "STRING"},
+            "code_outputs": {
+                "type": "OBJECT",
+                "properties": {lang_key: {"type": "STRING"} for lang_key in lang_keys},
+                "required": lang_keys
             }
+        },
+        "required": ["pseudocode", "flowchart", "code_outputs"]
+    }
+
+def validate_structured_output(data, lang_keys: List[str]) -> dict:
+    """Keep only the pieces of a structured response that are valid ProcessingResult content, keyed by stage name"""
+    if not isinstance(data, dict):
+        return {}
+    
+    valid = {}
+    if is_text(data.get("pseudocode")):
+        valid["pseudocode"] = data["pseudocode"]
+    flowchart = data.get("flowchart")
+    if is_text(flowchart) and flowchart.strip().startswith(("flowchart", "graph")):
+        valid["flowchart"] = flowchart
+    code_outputs = data.get("code_outputs")
+    if isinstance(code_outputs, dict):
+        for lang_key in lang_keys:
+            if is_text(code_outputs.get(lang_key)):
+                valid[lang_key] = code_outputs[lang_key]
+    return valid
+
+async def generate_structured_outputs(model, content: str, input_type: str, description: str, lang_keys: List[str], image: dict = None) -> dict:
+    """Ask Gemini for pseudocode, flowchart and code in one JSON response.
+
+    Returns only the pieces that validate, keyed by stage name; anything missing
+    is left for the per-stage prompts.
+    """
+    languages = ", ".join(f'"{lang_key}" ({PROGRAMMING_LANGUAGES[lang_key]})' for lang_key in lang_keys)
+    prompt = f"""{describe_input(content, input_type, description)}
+
+Respond with a JSON object containing:
+- "pseudocode": clear, structured pseudocode with proper indentation
+- "flowchart": Mermaid.js code starting with 'flowchart TD'
+- "code_outputs": an object mapping each of these keys to clean, well-commented code in that language: {languages}"""
+    prompt = with_image(prompt, image)
+    
+    try:
+        response_text = await generate_text(
+            model,
+            prompt,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=build_structured_schema(lang_keys)
+            )
+        )
+        return validate_structured_output(extract_json(response_text), lang_keys)
+    except Exception as e:
+        logging.error(f"Structured generation failed: {str(e)}")
+        return {}
+
+# How flowcharts were produced: parsed from the pseudocode locally, or generated by Gemini
+flowchart_counters = {"local": 0, "llm": 0}
+
+def build_processing_stages(model, session_id: str, content: str, input_type: str, description: str = None, target_language: str = None, languages: List[str] = None, on_pseudocode_chunk: Callable[[str], None] = None, prefilled: dict = None, image: dict = None) -> List[PipelineStage]:
+    """Build the stage graph for a /process request, leaving out stages it doesn't need.
+
+    `image` is an inline {"mime_type", "data"} part sent along with the pseudocode prompt.
+    When `on_pseudocode_chunk` is given the pseudocode is streamed to it token by token.
+    Stages named in `prefilled` return that output instead of calling Gemini.
+    """
+    # Direct code translation needs neither pseudocode nor the other languages
+    if input_type == "code" and target_language:
+        translate_prompt = f"Convert this code directly to {target_language}. Return only clean, working {target_language} code:\n\n{content}"
         
-        # Generate flowchart (Mermaid syntax)
-        flowchart_prompt = f"Based on this pseudocode:\n\n{pseudocode_response}\n\nCreate a Mermaid.js flowchart. Provide ONLY the Mermaid.js code starting with 'flowchart TD' or 'graph TD'."
-        response = await asyncio.to_thread(model.generate_content, flowchart_prompt)
-        flowchart_response = response.text
+        async def run_analysis(results):
+            translated_code = results["translation"]
+            return await analyze_code_with_ai(session_id, translated_code, {target_language: translated_code})
         
-        # Generate code in multiple languages
-        code_outputs = {}
-        for lang_key, lang_name in PROGRAMMING_LANGUAGES.items():
-            code_prompt = f"Convert this pseudocode to {lang_name}:\n\n{pseudocode_response}\n\nProvide ONLY the {lang_name} code, clean and well-commented."
-            response = await asyncio.to_thread(model.generate_content, code_prompt)
-            code_outputs[lang_key] = response.text
+        return [
+            PipelineStage("translation", lambda results: generate_text(model, translate_prompt)),
+            PipelineStage("analysis", run_analysis, requires=("translation",)),
+        ]
+    
+    pseudocode_prompt = build_pseudocode_prompt(content, input_type, description, image)
+    
+    async def run_pseudocode(results):
+        if on_pseudocode_chunk:
+            return await stream_text(model, pseudocode_prompt, on_pseudocode_chunk)
+        return await generate_text(model, pseudocode_prompt)
+    
+    def flowchart_prompt(results):
+        return f"Based on this pseudocode:\n\n{results['pseudocode']}\n\nCreate a Mermaid.js flowchart. Provide ONLY the Mermaid.js code starting with 'flowchart TD' or 'graph TD'."
+    
+    def code_stage(lang_key: str) -> PipelineStage:
+        lang_name = PROGRAMMING_LANGUAGES[lang_key]
+        return PipelineStage(lang_key, lambda results: generate_text(model, build_code_prompt(lang_name, results['pseudocode'])), requires=("pseudocode",))
+    
+    # Only the requested languages are generated; the rest can be fetched later from /result/{id}/code/{lang}
+    lang_keys = requested_language_keys(languages)
+    
+    async def run_analysis(results):
+        # Analysis only reads the Python output, so it doesn't wait on the other languages
+        code_outputs = {"python": results["python"]} if "python" in results else {}
+        return await analyze_code_with_ai(session_id, results["pseudocode"], code_outputs)
+    
+    async def run_flowchart(results):
+        # Structured pseudocode converts locally; Gemini only sees what the parser can't handle
+        flowchart = pseudocode_to_mermaid(results["pseudocode"])
+        if flowchart is not None:
+            flowchart_counters["local"] += 1
+            return flowchart
+        flowchart_counters["llm"] += 1
+        return await generate_text(model, flowchart_prompt(results))
+    
+    stages = [
+        PipelineStage("pseudocode", run_pseudocode),
+        PipelineStage("flowchart", run_flowchart, requires=("pseudocode",)),
+        *(code_stage(lang_key) for lang_key in lang_keys),
+        PipelineStage("analysis", run_analysis, requires=("pseudocode",), after=("python",) if "python" in lang_keys else ()),
+    ]
+    
+    if prefilled:
+        def prefilled_stage(stage: PipelineStage) -> PipelineStage:
+            async def run_prefilled(results):
+                return prefilled[stage.name]
+            return PipelineStage(stage.name, run_prefilled)
         
+        stages = [prefilled_stage(stage) if stage.name in prefilled else stage for stage in stages]
+    
+    return stages
+
+def collect_processing_output(input_type: str, target_language: str, results: dict, errors: dict, timings: dict) -> dict:
+    """Shape pipeline stage results into a process_with_gemini result, re-raising if the main stage failed"""
+    main_stage = "translation" if input_type == "code" and target_language else "pseudocode"
+    if main_stage not in results:
+        error = errors.get(main_stage)
+        raise error if isinstance(error, Exception) else RuntimeError(error or f"{main_stage} failed")
+    errors = {name: str(error) for name, error in errors.items()}
+    
+    if main_stage == "translation":
+        translated_code = results["translation"]
         return {
-            "pseudocode": pseudocode_response,
-            "flowchart": flowchart_response,
-            "code_outputs": code_outputs
+            "pseudocode": translated_code,  # Contains the translated code
+            "flowchart": "",
+            "code_outputs": {target_language: translated_code},
+            "code_analysis": results.get("analysis", {}),
+            "errors": errors,
+            "stage_timings": timings
         }
+    
+    return {
+        "pseudocode": results["pseudocode"],
+        "flowchart": results.get("flowchart", ""),
+        "code_outputs": {lang_key: results[lang_key] for lang_key in PROGRAMMING_LANGUAGES if lang_key in results},
+        "code_analysis": results.get("analysis", {}),
+        "errors": errors,
+        "stage_timings": timings
+    }
+
+async def process_with_gemini(session_id: str, content: str, input_type: str, description: str = None, target_language: str = None, languages: List[str] = None, structured: bool = False, image: dict = None):
+    """Process multimodal input and generate pseudocode, flowchart, code and analysis.
+
+    With `structured`, pseudocode, flowchart and code are requested in a single JSON
+    call and only the pieces that fail validation go through the per-stage prompts.
+    """
+    try:
+        model = await get_gemini_model()
+        
+        prefilled, structured_ms = None, None
+        if structured and not (input_type == "code" and target_language):
+            started = time.perf_counter()
+            prefilled = await generate_structured_outputs(model, content, input_type, description, requested_language_keys(languages), image)
+            structured_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        stages = build_processing_stages(model, session_id, content, input_type, description, target_language, languages, prefilled=prefilled, image=image)
+        results, errors, timings = await run_pipeline(stages)
+        if structured_ms is not None:
+            timings["structured"] = structured_ms
         
+        return collect_processing_output(input_type, target_language, results, errors, timings)
+        
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error processing with Gemini: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI processing failed: {str(e)}")
 
-async def analyze_code_with_ai(session_id: str, pseudocode: str, code_outputs: dict):
-    """Analyze code for complexity, optimization opportunities, and quality"""
+async def generate_json_fields(model, prompt: str, fields: dict, kind: str) -> dict:
+    """Call Gemini in JSON mode against `fields` and return the fields that validate"""
+    async def call(request_prompt: str, schema: dict) -> str:
+        response = await generate_content(
+            model,
+            request_prompt,
+            generation_config=genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+        )
+        return response.text
+    
+    return await request_json_fields(call, prompt, fields, kind)
+
+async def analyze_code_with_ai(session_id: str, pseudocode: str, code_outputs: dict, static_fallback: bool = True):
+    """Analyze code for complexity, optimization opportunities, and quality.
+
+    When the Python code parses, local static metrics are attached to the model's
+    analysis and stand in for it if the model is unavailable or returns bad JSON.
+    Chunked callers pass static_fallback=False and fall back on the whole file.
+    """
+    # Analyze the Python version (as representative)
+    python_code = code_outputs.get('python', '')
+    static_analysis = await asyncio.to_thread(analyze_python_statically, python_code) if static_fallback and python_code else None
+    
     try:
         model = await get_gemini_model()
         
-        # Analyze the Python version (as representative)
-        python_code = code_outputs.get('python', '')
-        
         analysis_prompt = f"""Analyze this code and provide:
 1. Time complexity (Big O notation)
 2. Space complexity (Big O notation)  
@@ -183,35 +665,33 @@ Pseudocode:
 Python Code:
 {python_code}
 
-Format response as JSON:
-{{
-  "time_complexity": "O(...)",
-  "space_complexity": "O(...)",
-  "quality_score": 8,
-  "optimizations": ["suggestion 1", "suggestion 2", "suggestion 3"],
-  "alternatives": ["approach 1", "approach 2"],
-  "learning_insights": ["insight 1", "insight 2"]
-}}"""
+Respond with a JSON object with the fields time_complexity, space_complexity,
+quality_score, optimizations, alternatives and learning_insights."""
 
-        response = await asyncio.to_thread(model.generate_content, analysis_prompt)
+        analysis = await generate_json_fields(model, analysis_prompt, ANALYSIS_FIELDS, "analysis")
+        if not analysis:
+            return static_analysis or copy.deepcopy(ANALYSIS_PENDING)
         
-        # Parse JSON response
-        import json
-        try:
-            return json.loads(response.text)
-        except Exception:
-            # Fallback if JSON parsing fails
-            return {
-                "time_complexity": "Analysis pending",
-                "space_complexity": "Analysis pending", 
-                "quality_score": 7,
-                "optimizations": ["Use more efficient algorithms", "Optimize memory usage", "Add error handling"],
-                "alternatives": ["Iterative approach", "Dynamic programming approach"],
-                "learning_insights": ["Understanding complexity is key", "Consider edge cases"]
-            }
+        # Whatever Gemini still left out comes from the static analysis, or the placeholder;
+        # either way the result is partial, so it isn't cached and can be asked for again
+        missing = [field for field in ANALYSIS_FIELDS if field not in analysis]
+        fallback = static_analysis or copy.deepcopy(ANALYSIS_PENDING)
+        analysis = {field: analysis.get(field, fallback[field]) for field in ANALYSIS_FIELDS}
+        analysis["analysis_source"] = "partial" if missing else "llm"
+        if missing:
+            analysis["missing_fields"] = missing
+        if static_analysis:
+            analysis["static_analysis"] = static_analysis["static_analysis"]
+        return analysis
             
+    except QuotaExceeded:
+        if static_analysis:
+            return static_analysis
+        raise
     except Exception as e:
         logging.error(f"Error analyzing code: {str(e)}")
+        if static_analysis:
+            return static_analysis
         return {
             "time_complexity": "Analysis failed",
             "space_complexity": "Analysis failed",
@@ -221,83 +701,779 @@ Format response as JSON:
             "learning_insights": ["Analysis temporarily unavailable"]
         }
 
-@api_router.post("/process", response_model=ProcessingResult)
-async def process_input(request: ProcessingRequest):
-    """Process multimodal input and generate pseudocode, flowchart, and code"""
-    try:
-        # Process with Gemini
+# Placeholder analysis when Gemini gives nothing usable and the code can't be analyzed statically
+ANALYSIS_PENDING = {
+    "time_complexity": "Analysis pending",
+    "space_complexity": "Analysis pending",
+    "quality_score": None,
+    "optimizations": [],
+    "alternatives": [],
+    "learning_insights": []
+}
+
+# Result cache configuration
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '512'))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', '86400'))
+
+# Placeholder analyses returned when Gemini fails; these must never be cached
+ANALYSIS_FALLBACK_STATES = ("Analysis pending", "Analysis failed")
+
+def normalize_content(content: str) -> str:
+    """Normalize line endings and surrounding whitespace so trivial edits share a cache entry"""
+    lines = content.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip()
+
+def result_cache_key(kind: str, request: ProcessingRequest) -> str:
+    """Content-addressed key for a request's generated output"""
+    payload = json.dumps([
+        kind,
+        request.input_type,
+        normalize_content(request.content),
+        request.description or "",
+        request.target_language or "",
+        sorted(request.languages) if request.languages is not None else None,
+        request.structured,
+        GEMINI_MODEL_NAME,
+        PROMPT_VERSION
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_cacheable_analysis(code_analysis: dict) -> bool:
+    """Only complete model analyses are cached, never placeholders, static stand-ins or partial ones"""
+    return (
+        bool(code_analysis)
+        and code_analysis.get("time_complexity") not in ANALYSIS_FALLBACK_STATES
+        and code_analysis.get("analysis_source") not in ("static", "partial")
+    )
+
+result_cache = ResultCache(db.result_cache, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+
+# processing_results documents are small headers; pseudocode, flowchart and code live
+# compressed in processing_result_bodies, one document per body
+RESULT_STORAGE_VERSION = 2
+RESULT_BODY_COMPRESSION_LEVEL = int(os.environ.get('RESULT_BODY_COMPRESSION_LEVEL', '6'))
+
+def code_body_name(lang: str) -> str:
+    return f"code:{lang}"
+
+def compress_body(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), RESULT_BODY_COMPRESSION_LEVEL)
+
+def decompress_body(body: dict) -> str:
+    if body["encoding"] != "zlib":
+        raise ValueError(f"Unsupported body encoding: {body['encoding']}")
+    return zlib.decompress(body["data"]).decode('utf-8')
+
+def result_body_document(result_id: str, name: str, text: str) -> dict:
+    return {
+        "_id": f"{result_id}:{name}",
+        "result_id": result_id,
+        "name": name,
+        "encoding": "zlib",
+        "data": compress_body(text)
+    }
+
+def split_result_document(result: dict):
+    """Split a full ProcessingResult dict into its header document and body documents"""
+    header = {key: value for key, value in result.items() if key not in ("pseudocode", "flowchart", "code_outputs")}
+    header["languages"] = list(result["code_outputs"])
+    header["storage_version"] = RESULT_STORAGE_VERSION
+    
+    bodies = [
+        result_body_document(result["id"], "pseudocode", result["pseudocode"]),
+        result_body_document(result["id"], "flowchart", result["flowchart"]),
+        *(result_body_document(result["id"], code_body_name(lang), code) for lang, code in result["code_outputs"].items())
+    ]
+    return header, bodies
+
+async def store_processing_results(processing_results: List[ProcessingResult]):
+    """Persist results as headers plus compressed bodies"""
+    headers, bodies = [], []
+    for processing_result in processing_results:
+        header, result_bodies = split_result_document(processing_result.dict())
+        headers.append(header)
+        bodies.extend(result_bodies)
+    
+    # Bodies first, so a header never points at bodies that don't exist yet
+    await db.processing_result_bodies.insert_many(bodies)
+    await db.processing_results.insert_many(headers)
+
+async def load_result_bodies(documents: List[dict], names: Optional[List[str]] = None) -> List[dict]:
+    """Fill pseudocode, flowchart and code_outputs into result documents in place.
+
+    Only the bodies in `names` are fetched (all of them when None). Documents
+    still in the legacy inline layout are left as they are.
+    """
+    result_ids = [document["id"] for document in documents if document.get("storage_version") == RESULT_STORAGE_VERSION]
+    if not result_ids:
+        return documents
+    
+    query = {"result_id": {"$in": result_ids}}
+    if names is not None:
+        query["name"] = {"$in": names}
+    
+    bodies = {result_id: {} for result_id in result_ids}
+    async for body in db.processing_result_bodies.find(query):
+        bodies[body["result_id"]][body["name"]] = decompress_body(body)
+    
+    for document in documents:
+        if document.get("storage_version") != RESULT_STORAGE_VERSION:
+            continue
+        result_bodies = bodies[document["id"]]
+        document["pseudocode"] = result_bodies.get("pseudocode", "")
+        document["flowchart"] = result_bodies.get("flowchart", "")
+        document["code_outputs"] = {
+            name[len("code:"):]: text for name, text in result_bodies.items() if name.startswith("code:")
+        }
+    return documents
+
+def validate_languages(request: ProcessingRequest):
+    """Reject language keys that aren't in PROGRAMMING_LANGUAGES"""
+    unknown_languages = set(request.languages or []) - set(PROGRAMMING_LANGUAGES)
+    if unknown_languages:
+        raise HTTPException(status_code=400, detail=f"Unsupported languages: {', '.join(sorted(unknown_languages))}")
+
+async def cache_processing_output(cache_key: str, result: dict):
+    """Cache a complete process_with_gemini result; partial or placeholder results are regenerated next time"""
+    if not result["errors"] and is_cacheable_analysis(result["code_analysis"]):
+        await result_cache.set(cache_key, "process", {**result, "stage_timings": {}})
+
+def build_processing_result(request: ProcessingRequest, result: dict) -> ProcessingResult:
+    return ProcessingResult(
+        session_id=request.session_id,
+        input_type=request.input_type,
+        pseudocode=result["pseudocode"],
+        flowchart=result["flowchart"],
+        code_outputs=result["code_outputs"],
+        code_analysis=result["code_analysis"],
+        errors=result["errors"],
+        stage_timings=result["stage_timings"]
+    )
+
+async def save_processing_result(request: ProcessingRequest, result: dict) -> ProcessingResult:
+    """Create and persist the ProcessingResult for a request"""
+    processing_result = build_processing_result(request, result)
+    await store_processing_results([processing_result])
+    return processing_result
+
+single_flight = SingleFlight()
+
+def single_flight_key(cache_key: str, request: ProcessingRequest) -> str:
+    # Cache-bypassing requests only coalesce with each other
+    return f"{cache_key}:{request.use_cache}"
+
+async def generate_processing_output(request: ProcessingRequest, cache_key: str, image: dict = None) -> dict:
+    """Return the cached or freshly generated process_with_gemini result for a request"""
+    result = await result_cache.get(cache_key) if request.use_cache else None
+    
+    if result is None:
+        # Process with Gemini (includes code analysis)
         result = await process_with_gemini(
             request.session_id, 
             request.content, 
             request.input_type,
             request.description,
-            getattr(request, 'target_language', None)
+            request.target_language,
+            request.languages,
+            request.structured,
+            image
         )
-        
-        # Analyze code quality and complexity
-        code_analysis = await analyze_code_with_ai(
-            request.session_id,
-            result["pseudocode"], 
-            result["code_outputs"]
-        )
-        
-        # Create result object
-        processing_result = ProcessingResult(
-            session_id=request.session_id,
-            input_type=request.input_type,
-            pseudocode=result["pseudocode"],
-            flowchart=result["flowchart"],
-            code_outputs=result["code_outputs"],
-            code_analysis=code_analysis
+        await cache_processing_output(cache_key, result)
+    
+    return result
+
+# Uploads are streamed in chunks and spooled to disk once they pass the threshold
+UPLOAD_CHUNK_BYTES = 64 * 1024
+UPLOAD_SPOOL_THRESHOLD_BYTES = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD_BYTES', str(1024 * 1024)))
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def image_mime_type(data: bytes, declared: str = None) -> str:
+    """MIME type for an image part, preferring the declared type and sniffing otherwise"""
+    if declared and declared.startswith("image/"):
+        return declared
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    return "image/png"
+
+async def read_upload(file: UploadFile, max_bytes: int):
+    """Stream an upload into a spooled temp file, rejecting it with 413 once it passes max_bytes.
+
+    Returns the spool rewound to the start; the caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD_BYTES)
+    size = 0
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    
+    spool.seek(0)
+    return spool
+
+async def load_request_image(request: ProcessingRequest) -> Optional[dict]:
+    """Decode base64 image content from a JSON request into an inline image part"""
+    if request.input_type != "image":
+        return None
+    try:
+        data = await asyncio.to_thread(base64.b64decode, request.content, validate=True)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Image content must be base64-encoded")
+    if len(data) > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds the {IMAGE_MAX_BYTES} byte limit")
+    return {"mime_type": image_mime_type(data), "data": data}
+
+async def run_process_request(request: ProcessingRequest, image: dict = None) -> ProcessingResult:
+    """Generate (or reuse) the output for a request and persist it as a new ProcessingResult"""
+    try:
+        cache_key = result_cache_key("process", request)
+        # Identical requests in flight share one pipeline run but each gets its own stored result
+        result = await single_flight.run(
+            single_flight_key(cache_key, request),
+            lambda: generate_processing_output(request, cache_key, image)
         )
         
-        # Save to database
-        await db.processing_results.insert_one(processing_result.dict())
-        
-        return processing_result
+        return await save_processing_result(request, result)
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Background /process jobs: workers per process, lease length, attempts and retention
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_VISIBILITY_TIMEOUT_SECONDS = float(os.environ.get('JOB_VISIBILITY_TIMEOUT_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', '1'))
+JOB_DRAIN_TIMEOUT_SECONDS = float(os.environ.get('JOB_DRAIN_TIMEOUT_SECONDS', '30'))
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+async def execute_job(request_data: dict) -> str:
+    request = ProcessingRequest(**request_data)
+    image = await load_request_image(request)
+    processing_result = await run_process_request(request, image)
+    return processing_result.id
+
+def job_retry_policy(error: Exception, attempts: int) -> Tuple[Optional[float], str]:
+    """Backoff before retrying a failed job, or None when retrying can't help, and the error to record"""
+    if isinstance(error, QuotaExceeded):
+        return error.retry_after, str(error)
+    retry_after = min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempts)
+    if isinstance(error, HTTPException):
+        return (retry_after if error.status_code >= 500 else None), str(error.detail)
+    return retry_after, str(error)
+
+job_queue = JobQueue(
+    db.processing_jobs,
+    execute_job,
+    job_retry_policy,
+    JOB_WORKERS,
+    JOB_VISIBILITY_TIMEOUT_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETENTION_SECONDS,
+    JOB_POLL_INTERVAL_SECONDS
+)
+
+@api_router.post("/process", response_model=ProcessingResult)
+async def process_input(request: ProcessingRequest, mode: str = "sync"):
+    """Process multimodal input and generate pseudocode, flowchart, and code.
+
+    With ?mode=job the request is queued and answered with 202 and a job id;
+    poll GET /api/jobs/{job_id} for the result.
+    """
+    if mode not in ("sync", "job"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'job'")
+    validate_languages(request)
+    image = await load_request_image(request)
+    
+    if mode == "job":
+        job = await job_queue.enqueue(request.dict())
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job["id"], "status": job["status"], "status_url": f"/api/jobs/{job['id']}"}
+        )
+    return await run_process_request(request, image)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued /process job, with the stored result once it has succeeded"""
+    job = await db.processing_jobs.find_one({"_id": job_id}, {"_id": 0, "request": 0, "lease_owner": 0, "expires_at": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job["result"] = None
+    if job["status"] == "succeeded":
+        document = await db.processing_results.find_one({"id": job["result_id"]}, {"_id": 0})
+        if document:
+            await load_result_bodies([document])
+            job["result"] = ProcessingResult(**document)
+    return job
+
+# Batch limits: items per request, and generations running at once across all batches
+PROCESS_BATCH_MAX_ITEMS = int(os.environ.get('PROCESS_BATCH_MAX_ITEMS', '100'))
+PROCESS_BATCH_CONCURRENCY = int(os.environ.get('PROCESS_BATCH_CONCURRENCY', '4'))
+batch_semaphore = asyncio.Semaphore(PROCESS_BATCH_CONCURRENCY)
+
+async def generate_batch_item(request: ProcessingRequest) -> dict:
+    """Generate one distinct batch item inside the shared batch budget"""
+    validate_languages(request)
+    image = await load_request_image(request)
+    cache_key = result_cache_key("process", request)
+    async with batch_semaphore:
+        return await single_flight.run(
+            single_flight_key(cache_key, request),
+            lambda: generate_processing_output(request, cache_key, image)
+        )
+
+@api_router.post("/process-batch", response_model=BatchProcessingResult)
+async def process_batch(batch: BatchProcessingRequest):
+    """Process many inputs in one request.
+
+    Identical items are generated once, generation runs under a concurrency
+    budget shared by all batches so they can't crowd out /process, and every
+    successful item is stored in one insert_many. An item that fails gets its
+    own status_code and error; the rest of the batch is unaffected.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(batch.items) > PROCESS_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batches are limited to {PROCESS_BATCH_MAX_ITEMS} items")
+    
+    # Items that would produce the same output share a generation (session_id doesn't affect it)
+    unique_requests = {}
+    item_keys = []
+    for request in batch.items:
+        key = single_flight_key(result_cache_key("process", request), request)
+        unique_requests.setdefault(key, request)
+        item_keys.append(key)
+    
+    keys = list(unique_requests)
+    outputs = await asyncio.gather(*(generate_batch_item(unique_requests[key]) for key in keys), return_exceptions=True)
+    output_by_key = dict(zip(keys, outputs))
+    
+    item_results, processing_results = [], []
+    for index, (request, key) in enumerate(zip(batch.items, item_keys)):
+        output = output_by_key[key]
+        if isinstance(output, HTTPException):
+            item_results.append(BatchItemResult(index=index, status_code=output.status_code, error=str(output.detail)))
+        elif isinstance(output, QuotaExceeded):
+            item_results.append(BatchItemResult(index=index, status_code=429, error=str(output)))
+        elif isinstance(output, BaseException):
+            logging.error(f"Error processing batch item {index}: {str(output)}")
+            item_results.append(BatchItemResult(index=index, status_code=500, error=str(output)))
+        else:
+            processing_result = build_processing_result(request, copy.deepcopy(output))
+            processing_results.append(processing_result)
+            item_results.append(BatchItemResult(index=index, result=processing_result))
+    
+    if processing_results:
+        try:
+            await store_processing_results(processing_results)
+        except Exception as e:
+            logging.error(f"Error storing batch results: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return BatchProcessingResult(results=item_results, unique_items=len(keys))
+
+def format_sse(event: str, data) -> str:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@api_router.post("/process/stream")
+async def process_input_stream(request: ProcessingRequest):
+    """Stream /process as Server-Sent Events.
+
+    Emits `token` events while the pseudocode is generated, a `stage` event as each
+    stage finishes, and a final `done` event with the persisted result id (or `error`).
+    """
+    validate_languages(request)
+    image = await load_request_image(request)
+    
+    async def events():
+        pipeline_task = None
+        try:
+            cache_key = result_cache_key("process", request)
+            cached = await result_cache.get(cache_key) if request.use_cache else None
+            if cached is not None:
+                for stage, output in (("pseudocode", cached["pseudocode"]), ("flowchart", cached["flowchart"]),
+                                      *cached["code_outputs"].items(), ("analysis", cached["code_analysis"])):
+                    yield format_sse("stage", {"stage": stage, "output": output, "error": None, "cached": True})
+                processing_result = await save_processing_result(request, cached)
+                yield format_sse("done", {"id": processing_result.id, "errors": {}, "stage_timings": {}})
+                return
+            
+            queue = asyncio.Queue()
+            model = await get_gemini_model()
+            stages = build_processing_stages(
+                model,
+                request.session_id,
+                request.content,
+                request.input_type,
+                request.description,
+                request.target_language,
+                request.languages,
+                on_pseudocode_chunk=lambda text: queue.put_nowait(("token", {"text": text})),
+                image=image
+            )
+            
+            async def run():
+                try:
+                    return await run_pipeline(
+                        stages,
+                        on_stage_complete=lambda name, output, error: queue.put_nowait(
+                            ("stage", {"stage": name, "output": output, "error": error})
+                        )
+                    )
+                finally:
+                    queue.put_nowait(None)
+            
+            pipeline_task = asyncio.create_task(run())
+            while (event := await queue.get()) is not None:
+                yield format_sse(*event)
+            
+            results, errors, timings = await pipeline_task
+            result = collect_processing_output(request.input_type, request.target_language, results, errors, timings)
+            await cache_processing_output(cache_key, result)
+            processing_result = await save_processing_result(request, result)
+            yield format_sse("done", {"id": processing_result.id, "errors": result["errors"], "stage_timings": timings})
+        except QuotaExceeded as e:
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logging.error(f"Error streaming request: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            # Stop generating if the client went away mid-stream
+            if pipeline_task:
+                pipeline_task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/result/{result_id}/code/{lang}")
+async def get_result_code(result_id: str, lang: str):
+    """Return one language of a stored result, generating and persisting it on first request"""
+    if lang not in PROGRAMMING_LANGUAGES:
+        raise HTTPException(status_code=404, detail=f"Unsupported language: {lang}")
+    
+    result = await db.processing_results.find_one(
+        {"id": result_id},
+        {"_id": 0, "id": 1, "storage_version": 1, "pseudocode": 1, f"code_outputs.{lang}": 1}
+    )
+    if not result:
+        raise HTTPException(status_code=404, detail="Result not found")
+    await load_result_bodies([result], ["pseudocode", code_body_name(lang)])
+    
+    code = result.get("code_outputs", {}).get(lang)
+    if code is None:
+        try:
+            model = await get_gemini_model()
+            code = await generate_text(model, build_code_prompt(PROGRAMMING_LANGUAGES[lang], result["pseudocode"]))
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            logging.error(f"Error generating {lang} code for result {result_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"AI processing failed: {str(e)}")
+        
+        # Targeted writes so concurrent requests for other languages don't overwrite each other
+        if result.get("storage_version") == RESULT_STORAGE_VERSION:
+            body = result_body_document(result_id, code_body_name(lang), code)
+            await db.processing_result_bodies.replace_one({"_id": body["_id"]}, body, upsert=True)
+            await db.processing_results.update_one(
+                {"id": result_id},
+                {"$addToSet": {"languages": lang}, "$unset": {f"errors.{lang}": ""}}
+            )
+        else:
+            await db.processing_results.update_one(
+                {"id": result_id},
+                {"$set": {f"code_outputs.{lang}": code}, "$unset": {f"errors.{lang}": ""}}
+            )
+    
+    return {
+        "id": result_id,
+        "language": lang,
+        "code": code
+    }
+
+# Re-uploads of the same image reuse an earlier result. Exact copies match on SHA-256;
+# re-encoded or resized copies match on a 64-bit difference hash when Pillow is installed.
+# A 64-bit hash can't tell similar screenshots from different people apart, so perceptual
+# matches only reuse results from the uploader's own session.
+IMAGE_PHASH_MAX_DISTANCE = int(os.environ.get('IMAGE_PHASH_MAX_DISTANCE', '4'))
+IMAGE_PHASH_CANDIDATES = int(os.environ.get('IMAGE_PHASH_CANDIDATES', '200'))
+# Larger images aren't decoded for hashing: a small compressed PNG can expand to hundreds of MB
+IMAGE_PHASH_MAX_PIXELS = int(os.environ.get('IMAGE_PHASH_MAX_PIXELS', str(16 * 1024 * 1024)))
+
+image_dedupe_counters = {"exact_hits": 0, "perceptual_hits": 0, "misses": 0}
+
+def perceptual_hash(data: bytes) -> Optional[str]:
+    """64-bit difference hash of an image as hex, or None if it can't be computed"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # Only the header has been read so far
+            if img.size[0] * img.size[1] > IMAGE_PHASH_MAX_PIXELS:
+                return None
+            # JPEGs decode straight to a small greyscale image; other formats ignore this
+            img.draft("L", (64, 64))
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception as e:
+        logging.error(f"Error hashing image: {str(e)}")
+        return None
+    
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def fingerprint_image(data: bytes) -> dict:
+    """SHA-256 and perceptual hash of an image; CPU-bound, so run it in a thread"""
+    return {"sha256": hashlib.sha256(data).hexdigest(), "phash": perceptual_hash(data)}
+
+def image_description_key(description: str = None) -> str:
+    return normalize_content(description or "").lower()
+
+async def find_duplicate_image_result(fingerprint: dict, session_id: str, description: str = None) -> Optional[dict]:
+    """Return the stored output of an earlier result for the same image and description"""
+    description_key = image_description_key(description)
+    match = await db.image_fingerprints.find_one(
+        {"sha256": fingerprint["sha256"], "description_key": description_key},
+        sort=[("created_at", -1)]
+    )
+    if match:
+        image_dedupe_counters["exact_hits"] += 1
+    elif fingerprint["phash"]:
+        target = int(fingerprint["phash"], 16)
+        candidates = await db.image_fingerprints.find(
+            {"session_id": session_id, "description_key": description_key, "phash": {"$ne": None}}
+        ).sort("created_at", -1).limit(IMAGE_PHASH_CANDIDATES).to_list(IMAGE_PHASH_CANDIDATES)
+        distance, match = min(
+            ((bin(target ^ int(candidate["phash"], 16)).count("1"), candidate) for candidate in candidates),
+            key=lambda item: item[0],
+            default=(None, None)
+        )
+        if match and distance <= IMAGE_PHASH_MAX_DISTANCE:
+            image_dedupe_counters["perceptual_hits"] += 1
+        else:
+            match = None
+    
+    if not match:
+        image_dedupe_counters["misses"] += 1
+        return None
+    
+    result = await db.processing_results.find_one({"id": match["result_id"]}, {"_id": 0})
+    if not result or result.get("errors") or not is_cacheable_analysis(result.get("code_analysis", {})):
+        return None
+    await load_result_bodies([result])
+    return {
+        "pseudocode": result["pseudocode"],
+        "flowchart": result["flowchart"],
+        "code_outputs": result["code_outputs"],
+        "code_analysis": result.get("code_analysis", {}),
+        "errors": result.get("errors", {}),
+        "stage_timings": {}
+    }
+
+async def remember_image_fingerprint(fingerprint: dict, session_id: str, description: str, result_id: str):
+    try:
+        await db.image_fingerprints.insert_one({
+            **fingerprint,
+            "session_id": session_id,
+            "description_key": image_description_key(description),
+            "result_id": result_id,
+            "created_at": datetime.utcnow()
+        })
+    except Exception as e:
+        logging.error(f"Error storing image fingerprint: {str(e)}")
+
 @api_router.post("/process-image")
 async def process_image(
     file: UploadFile = File(...),
     session_id: str = Form(...),
-    description: str = Form(None)
+    description: str = Form(None),
+    use_cache: bool = Form(True)
 ):
     """Process uploaded image"""
     try:
-        # Read and encode image
-        content = await file.read()
-        base64_content = base64.b64encode(content).decode('utf-8')
+        # Stream the upload to a spool and hand the raw bytes to Gemini as an inline part
+        spool = await read_upload(file, IMAGE_MAX_BYTES)
+        try:
+            data = await asyncio.to_thread(spool.read)
+        finally:
+            spool.close()
+        image = {"mime_type": image_mime_type(data, file.content_type), "data": data}
         
-        # Create processing request
+        # The image itself is the content; its digest keys the result cache
+        fingerprint = await asyncio.to_thread(fingerprint_image, data)
         request = ProcessingRequest(
             session_id=session_id,
             input_type="image",
-            content=base64_content,
-            description=description
+            content=f"sha256:{fingerprint['sha256']}",
+            description=description,
+            use_cache=use_cache
         )
         
+        # A re-upload of an image we've already seen skips the vision call entirely
+        if use_cache:
+            duplicate = await find_duplicate_image_result(fingerprint, session_id, description)
+            if duplicate:
+                return await save_processing_result(request, duplicate)
+        
         # Process the image
-        result = await process_input(request)
-        return result
+        processing_result = await run_process_request(request, image)
+        # Only clean results are worth handing to later uploads
+        if not processing_result.errors and is_cacheable_analysis(processing_result.code_analysis):
+            await remember_image_fingerprint(fingerprint, session_id, description, processing_result.id)
+        return processing_result
         
+    except (HTTPException, QuotaExceeded):
+        raise
     except Exception as e:
         logging.error(f"Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Code larger than one chunk is analysed piecewise and the results merged
+CODE_FILE_MAX_BYTES = int(os.environ.get('CODE_FILE_MAX_BYTES', str(512 * 1024)))
+CODE_ANALYSIS_CHUNK_CHARS = int(os.environ.get('CODE_ANALYSIS_CHUNK_CHARS', '16000'))
+MERGED_SUGGESTIONS_LIMIT = 5
+
+def merge_unique(lists: List[List[str]], limit: int) -> List[str]:
+    merged = []
+    for items in lists:
+        for item in items or []:
+            if item not in merged:
+                merged.append(item)
+    return merged[:limit]
+
+def merge_chunk_analyses(chunks: List[str], analyses: List[dict]) -> dict:
+    """Combine per-chunk analyses into one code_analysis for the whole file.
+
+    Complexity is the most expensive chunk's, the quality score is weighted by
+    chunk size, and suggestions are de-duplicated across chunks.
+    """
+    usable = [(chunk, analysis) for chunk, analysis in zip(chunks, analyses) if is_cacheable_analysis(analysis)]
+    if not usable:
+        return analyses[0]
+    
+    def dominant(field: str) -> str:
+        return max((analysis.get(field, "") for _, analysis in usable), key=complexity_rank)
+    
+    scored = [(len(chunk), analysis["quality_score"]) for chunk, analysis in usable
+              if isinstance(analysis.get("quality_score"), (int, float))]
+    total_size = sum(size for size, _ in scored)
+    
+    return {
+        "time_complexity": dominant("time_complexity"),
+        "space_complexity": dominant("space_complexity"),
+        "quality_score": round(sum(size * score for size, score in scored) / total_size, 1) if total_size else 7,
+        "optimizations": merge_unique([analysis.get("optimizations") for _, analysis in usable], MERGED_SUGGESTIONS_LIMIT),
+        "alternatives": merge_unique([analysis.get("alternatives") for _, analysis in usable], MERGED_SUGGESTIONS_LIMIT),
+        "learning_insights": merge_unique([analysis.get("learning_insights") for _, analysis in usable], MERGED_SUGGESTIONS_LIMIT),
+        "chunks": len(chunks)
+    }
+
+async def analyze_code_in_chunks(session_id: str, code: str) -> dict:
+    """Analyze code that may exceed one prompt, map-reducing over top-level chunks"""
+    chunks = split_code_into_chunks(code, CODE_ANALYSIS_CHUNK_CHARS)
+    if len(chunks) == 1:
+        return await analyze_code_with_ai(session_id, "", {"python": code})
+    
+    # A chunk may not parse on its own, so the static fallback is computed over the whole file
+    static_analysis, *analyses = await asyncio.gather(
+        asyncio.to_thread(analyze_python_statically, code),
+        *(analyze_code_with_ai(session_id, "", {"python": chunk}, static_fallback=False) for chunk in chunks)
+    )
+    merged = merge_chunk_analyses(chunks, analyses)
+    if not static_analysis:
+        return merged
+    if not is_cacheable_analysis(merged):
+        return static_analysis
+    merged["analysis_source"] = "llm"
+    merged["static_analysis"] = static_analysis["static_analysis"]
+    return merged
+
+async def generate_code_analysis(request: ProcessingRequest, cache_key: str) -> dict:
+    """Return the cached or freshly generated analysis of request.content"""
+    cached = await result_cache.get(cache_key) if request.use_cache else None
+    if cached is not None:
+        return cached["code_analysis"]
+    
+    if request.analysis_mode == "fast":
+        static_analysis = await asyncio.to_thread(analyze_python_statically, request.content)
+        if static_analysis:
+            schedule_analysis_enrichment(request, cache_key)
+            static_analysis["enrichment_pending"] = True
+            return static_analysis
+    
+    # Get analysis directly without full processing
+    code_analysis = await analyze_code_in_chunks(request.session_id, request.content)
+    if is_cacheable_analysis(code_analysis):
+        await result_cache.set(cache_key, "analysis", {"code_analysis": code_analysis})
+    return code_analysis
+
+# Background Gemini analyses started by fast-mode requests, held so they aren't garbage collected
+analysis_enrichments = set()
+
+def schedule_analysis_enrichment(request: ProcessingRequest, cache_key: str):
+    """Run the full analysis in the background so the next request for this code hits the cache.
+
+    It goes through single_flight like a full-mode request, so repeated fast
+    requests and concurrent full ones share one Gemini call.
+    """
+    full_request = request.copy(update={"analysis_mode": "full", "use_cache": True})
+    
+    async def enrich():
+        try:
+            await single_flight.run(
+                single_flight_key(cache_key, full_request),
+                lambda: generate_code_analysis(full_request, cache_key)
+            )
+        except Exception as e:
+            logging.warning(f"Background analysis enrichment failed: {str(e)}")
+    
+    task = asyncio.create_task(enrich())
+    analysis_enrichments.add(task)
+    task.add_done_callback(analysis_enrichments.discard)
+
 @api_router.post("/analyze-code")
 async def analyze_code_only(request: ProcessingRequest):
-    """Analyze existing code for complexity, optimization, and learning insights"""
+    """Analyze existing code for complexity, optimization, and learning insights.
+
+    With analysis_mode='fast', Python code is answered from local static analysis
+    unless a Gemini analysis is already cached; one is generated in the background.
+    """
+    if request.analysis_mode not in ("full", "fast"):
+        raise HTTPException(status_code=400, detail="analysis_mode must be 'full' or 'fast'")
+    
     try:
-        # Get analysis directly without full processing
-        code_analysis = await analyze_code_with_ai(
-            request.session_id,
-            "", # No pseudocode for direct analysis
-            {"python": request.content} # Use input as code
-        )
+        cache_key = result_cache_key("analysis", request)
+        if request.analysis_mode == "fast":
+            # Cheap enough not to coalesce, and must not wait behind an in-flight Gemini call
+            code_analysis = await generate_code_analysis(request, cache_key)
+        else:
+            code_analysis = await single_flight.run(
+                single_flight_key(cache_key, request),
+                lambda: generate_code_analysis(request, cache_key)
+            )
         
         # Return analysis-only result
         return {
@@ -307,6 +1483,8 @@ async def analyze_code_only(request: ProcessingRequest):
             "original_code": request.content
         }
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error analyzing code: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -318,9 +1496,16 @@ async def analyze_code_file(
 ):
     """Analyze uploaded code file"""
     try:
-        # Read file content
-        content = await file.read()
-        code_content = content.decode('utf-8')
+        # Stream the file in, enforcing the size limit as it arrives
+        spool = await read_upload(file, CODE_FILE_MAX_BYTES)
+        try:
+            content = await asyncio.to_thread(spool.read)
+        finally:
+            spool.close()
+        try:
+            code_content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Code file must be UTF-8 text")
         
         # Create analysis request
         request = ProcessingRequest(
@@ -333,21 +1518,68 @@ async def analyze_code_file(
         result = await analyze_code_only(request)
         return result
         
+    except (HTTPException, QuotaExceeded):
+        raise
     except Exception as e:
         logging.error(f"Error analyzing code file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-async def get_session_history(session_id: str):
-    """Get processing history for a session"""
+
+SESSION_HISTORY_MAX_LIMIT = 100
+
+def encode_history_cursor(result: dict) -> str:
+    """Opaque cursor pointing just past a result in (timestamp, id) order"""
+    position = json.dumps({"timestamp": result["timestamp"].isoformat(), "id": result["id"]})
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_history_cursor(cursor: str) -> dict:
+    """Turn a cursor back into a filter for the results that come after it"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        timestamp = datetime.fromisoformat(position["timestamp"])
+        result_id = position["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "id": {"$lt": result_id}}
+    ]}
+
+@api_router.get("/session/{session_id}", response_model=SessionHistory)
+async def get_session_history(session_id: str, limit: int = 20, cursor: Optional[str] = None, fields: str = "full"):
+    """Get processing history for a session, newest first.
+
+    Pages are `limit` results long; pass `next_cursor` back as `cursor` for the
+    next page. `fields=summary` leaves out code_outputs.
+    """
+    if fields not in ("full", "summary"):
+        raise HTTPException(status_code=400, detail="fields must be 'full' or 'summary'")
+    limit = max(1, min(limit, SESSION_HISTORY_MAX_LIMIT))
+    
+    query = {"session_id": session_id}
+    if cursor:
+        query.update(decode_history_cursor(cursor))
+    projection = {"_id": 0, "code_outputs": 0} if fields == "summary" else {"_id": 0}
+    
     try:
-        results = await db.processing_results.find(
-            {"session_id": session_id}
-        ).sort("timestamp", -1).to_list(100)
+        # Served by the (session_id, timestamp, id) index; one extra row tells us if there's another page
+        results = await db.processing_results.find(query, projection).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
         
-        processing_results = [ProcessingResult(**result) for result in results]
+        next_cursor = encode_history_cursor(results[limit - 1]) if len(results) > limit else None
+        results = results[:limit]
+        if fields == "summary":
+            await load_result_bodies(results, ["pseudocode", "flowchart"])
+            result_model = ProcessingResultSummary
+        else:
+            await load_result_bodies(results)
+            result_model = ProcessingResult
         
         return SessionHistory(
             session_id=session_id,
-            results=processing_results
+            results=[result_model(**result) for result in results],
+            next_cursor=next_cursor
         )
         
     except Exception as e:
@@ -359,80 +1591,309 @@ async def coach_endpoint(request: dict):
     """Coach endpoint - alias for /chat"""
     return await chat_about_code(request)
 
-@api_router.post("/chat")
-async def chat_about_code(request: dict):
-    """Interactive chat about code analysis or results with adaptive responses"""
+def validate_chat_request(request: dict) -> Tuple[str, str, dict]:
+    """session_id, message and context of a chat request, or 400"""
     session_id = request.get('session_id')
     message = request.get('message')
     context = request.get('context', {})  # Contains code, analysis, etc.
     
     if not session_id or not message:
         raise HTTPException(status_code=400, detail="Session ID and message are required")
+    return session_id, message, context
+
+def build_chat_preamble(context: dict, profile: UserProfile) -> str:
+    """Opening of a tutoring conversation: the user's skill level and the code context"""
+    # Build context-aware prompt with skill level adaptation
+    context_prompt = ""
+    if context.get('code'):
+        context_prompt += f"Code being discussed:\n{context['code']}\n\n"
+    if context.get('analysis'):
+        analysis = context['analysis']
+        context_prompt += "Previous Analysis:\n"
+        context_prompt += f"- Time Complexity: {analysis.get('time_complexity', 'N/A')}\n"
+        context_prompt += f"- Space Complexity: {analysis.get('space_complexity', 'N/A')}\n"
+        context_prompt += f"- Quality Score: {analysis.get('quality_score', 'N/A')}/10\n\n"
     
-    try:
-        # Get user profile for personalized responses
-        profile = await get_user_profile(session_id)
-        
-        model = await get_gemini_model()
-        
-        # Build context-aware prompt with skill level adaptation
-        context_prompt = ""
-        if context.get('code'):
-            context_prompt += f"Code being discussed:\n{context['code']}\n\n"
-        if context.get('analysis'):
-            analysis = context['analysis']
-            context_prompt += "Previous Analysis:\n"
-            context_prompt += f"- Time Complexity: {analysis.get('time_complexity', 'N/A')}\n"
-            context_prompt += f"- Space Complexity: {analysis.get('space_complexity', 'N/A')}\n"
-            context_prompt += f"- Quality Score: {analysis.get('quality_score', 'N/A')}/10\n\n"
-        
-        # Adapt response based on skill level
-        skill_instruction = {
-            "beginner": "Explain concepts simply with basic examples and avoid complex jargon.",
-            "intermediate": "Provide moderate detail with some technical terms and practical examples.", 
-            "advanced": "Give comprehensive technical explanations with advanced concepts and optimizations."
-        }.get(profile.skill_level, "Explain concepts clearly and appropriately.")
-        
-        # Create adaptive conversational prompt
-        full_prompt = f"""You are an expert programming tutor having a conversation about code. 
+    # Adapt response based on skill level
+    skill_instruction = {
+        "beginner": "Explain concepts simply with basic examples and avoid complex jargon.",
+        "intermediate": "Provide moderate detail with some technical terms and practical examples.", 
+        "advanced": "Give comprehensive technical explanations with advanced concepts and optimizations."
+    }.get(profile.skill_level, "Explain concepts clearly and appropriately.")
+    
+    # Create adaptive conversational prompt
+    return f"""You are an expert programming tutor having a conversation about code. 
 
 User Skill Level: {profile.skill_level}
 Instruction: {skill_instruction}
 
-{context_prompt}User question: {message}
+{context_prompt}"""
+
+def build_chat_question(message: str) -> str:
+    return f"""User question: {message}
 
 Provide a helpful, conversational response adapted to their skill level. Be specific about the code when relevant. Keep responses concise but informative."""
 
-        response_obj = await asyncio.to_thread(model.generate_content, full_prompt)
-        response = response_obj.text
+async def record_chat_interaction(session_id: str, message: str, context: dict, response: str):
+    """Update interaction history"""
+    interaction = {
+        "message": message,
+        "response_length": len(response),
+        "timestamp": datetime.utcnow().isoformat(),
+        "context_type": "analysis" if context.get('analysis') else "code" if context.get('code') else "general"
+    }
+    await record_interaction(session_id, interaction)
+
+# Server-side chat sessions: how many stay live per worker, idle lifetime, and history size before compaction
+CHAT_SESSION_MAX_LIVE = int(os.environ.get('CHAT_SESSION_MAX_LIVE', '1000'))
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get('CHAT_SESSION_TTL_SECONDS', '1800'))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '4000'))
+CHAT_RECENT_TURNS = int(os.environ.get('CHAT_RECENT_TURNS', '2'))  # question/answer pairs kept verbatim when compacting
+
+def chat_context_key(context: dict) -> str:
+    return hashlib.sha256(json.dumps(context or {}, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class ChatSession:
+    """One tutoring conversation: its code context, a summary of compacted turns, and the recent turns"""
+    
+    def __init__(self, context: dict):
+        self.context = context
+        self.context_key = chat_context_key(context)
+        self.summary = ""
+        self.turns = []  # alternating user/model chat contents, oldest first
+        self.lock = asyncio.Lock()  # one turn at a time per conversation
+        self.compacting = False
+    
+    def contents(self, message: str, profile: UserProfile) -> List[dict]:
+        """Chat contents for the next turn; the context and summary lead the oldest kept question"""
+        intro = build_chat_preamble(self.context, profile)
+        if self.summary:
+            intro += f"Summary of the conversation so far:\n{self.summary}\n\n"
+        turns = [*self.turns, {"role": "user", "parts": [build_chat_question(message)]}]
+        return [{"role": "user", "parts": [intro + turns[0]["parts"][0]]}, *turns[1:]]
+    
+    def add_turn(self, message: str, response: str):
+        self.turns.append({"role": "user", "parts": [build_chat_question(message)]})
+        self.turns.append({"role": "model", "parts": [response]})
+    
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.turns) + len(self.summary) // 4 if self.turns else 0
+
+class ChatSessionStore:
+    """Per-worker LRU of live ChatSessions with idle expiry and background summarising of old turns"""
+    
+    def __init__(self, max_live: int, ttl_seconds: float, token_budget: int, recent_turns: int):
+        self.max_live = max_live
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.sessions = OrderedDict()  # session_id -> (expires_at, ChatSession)
+        self.compactions = set()
+        self.counters = {"started": 0, "resumed": 0, "evicted": 0, "compactions": 0, "compaction_errors": 0}
+    
+    def get(self, session_id: str, context: Optional[dict], reset: bool = False) -> ChatSession:
+        """The live session to continue, or a new one when there is none, it expired, or the context changed"""
+        entry = self.sessions.get(session_id)
+        session = None
+        if entry is not None and entry[0] > time.monotonic() and not reset:
+            session = entry[1]
+            if context and chat_context_key(context) != session.context_key:
+                session = None
         
-        # Update interaction history
-        interaction = {
-            "message": message,
-            "response_length": len(response),
-            "timestamp": datetime.utcnow().isoformat(),
-            "context_type": "analysis" if context.get('analysis') else "code" if context.get('code') else "general"
-        }
-        profile.interaction_history.append(interaction)
-        await save_user_profile(profile)
+        if session is None:
+            session = ChatSession(context or {})
+            self.counters["started"] += 1
+        else:
+            self.counters["resumed"] += 1
+        
+        self.sessions[session_id] = (time.monotonic() + self.ttl_seconds, session)
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_live:
+            self.sessions.popitem(last=False)
+            self.counters["evicted"] += 1
+        return session
+    
+    def schedule_compaction(self, session: ChatSession, model):
+        if session.compacting or session.history_tokens() <= self.token_budget or len(session.turns) <= 2 * self.recent_turns:
+            return
+        session.compacting = True
+        task = asyncio.create_task(self.compact(session, model))
+        self.compactions.add(task)
+        task.add_done_callback(self.compactions.discard)
+    
+    async def compact(self, session: ChatSession, model):
+        """Fold all but the recent turns into the session summary"""
+        older = session.turns[:-2 * self.recent_turns]
+        transcript = "\n\n".join(
+            f"{'Student' if turn['role'] == 'user' else 'Tutor'}: {turn['parts'][0]}" for turn in older
+        )
+        previous = f"Summary so far:\n{session.summary}\n\n" if session.summary else ""
+        prompt = f"""Summarize this programming tutoring conversation in a short paragraph. Keep the questions asked, the explanations given and anything the student struggled with.
+
+{previous}Conversation:
+{transcript}"""
+        try:
+            summary = await generate_text(model, prompt)
+            # Turns are only ever appended, so the summarised ones are still at the front
+            session.summary = summary.strip()
+            del session.turns[:len(older)]
+            self.counters["compactions"] += 1
+        except Exception as e:
+            self.counters["compaction_errors"] += 1
+            logging.warning(f"Error compacting chat history: {str(e)}")
+        finally:
+            session.compacting = False
+    
+    def stats(self) -> dict:
+        return {**self.counters, "live_sessions": len(self.sessions)}
+
+# Sessions live in one worker's memory, so clients keep sending `context`; it is ignored while it matches the live session
+chat_sessions = ChatSessionStore(CHAT_SESSION_MAX_LIVE, CHAT_SESSION_TTL_SECONDS, CHAT_HISTORY_TOKEN_BUDGET, CHAT_RECENT_TURNS)
+
+# Near-duplicate answer cache for first questions about the same code at the same skill level
+CHAT_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_ANSWER_CACHE_MAX_ENTRIES', '2048'))
+CHAT_ANSWER_CACHE_TTL_SECONDS = float(os.environ.get('CHAT_ANSWER_CACHE_TTL_SECONDS', '3600'))
+CHAT_ANSWER_SIMILARITY_THRESHOLD = float(os.environ.get('CHAT_ANSWER_SIMILARITY_THRESHOLD', '0.8'))  # Jaccard over shingles
+CHAT_ANSWER_MINHASH_BANDS = int(os.environ.get('CHAT_ANSWER_MINHASH_BANDS', '16'))
+CHAT_ANSWER_MINHASH_ROWS = int(os.environ.get('CHAT_ANSWER_MINHASH_ROWS', '4'))
+
+chat_answers = ChatAnswerCache(
+    CHAT_ANSWER_CACHE_MAX_ENTRIES, CHAT_ANSWER_CACHE_TTL_SECONDS, CHAT_ANSWER_SIMILARITY_THRESHOLD,
+    CHAT_ANSWER_MINHASH_BANDS, CHAT_ANSWER_MINHASH_ROWS
+)
+
+def chat_answer_bucket(session: ChatSession, profile: UserProfile, request: dict) -> Optional[str]:
+    """Answer cache bucket for this turn, or None if its answer can't be shared.
+
+    Only the first question of a conversation about some code is shared; later answers
+    depend on the history, and without code every learner would share one pool.
+    """
+    if request.get('use_cache', True) is False or not session.context or session.turns or session.summary:
+        return None
+    return f"{session.context_key}:{profile.skill_level}"
+
+@api_router.post("/chat")
+async def chat_about_code(request: dict):
+    """Interactive chat about code analysis or results with adaptive responses"""
+    session_id, message, context = validate_chat_request(request)
+    
+    try:
+        # Get user profile for personalized responses
+        profile = await get_user_profile(session_id)
+        
+        model = await get_gemini_model()
+        session = chat_sessions.get(session_id, context, reset=bool(request.get('reset')))
+        async with session.lock:
+            bucket = chat_answer_bucket(session, profile, request)
+            response = chat_answers.get(bucket, message) if bucket else None
+            cached = response is not None
+            if not cached:
+                response_obj = await generate_content(model, session.contents(message, profile))
+                response = response_obj.text
+                if bucket:
+                    chat_answers.set(bucket, message, response)
+            session.add_turn(message, response)
+        chat_sessions.schedule_compaction(session, model)
+        
+        await record_chat_interaction(session_id, message, session.context, response)
         
         return {
             "session_id": session_id,
             "message": message,
             "response": response,
             "skill_level": profile.skill_level,
+            "cached": cached,
             "timestamp": datetime.utcnow().isoformat()
         }
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error in chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def analyze_user_skill_level(session_id: str, interaction_data: dict):
-    """Analyze user's skill level based on interactions"""
+@api_router.post("/coach/stream")
+async def coach_stream_endpoint(request: dict):
+    """Coach endpoint - alias for /chat/stream"""
+    return await chat_about_code_stream(request)
+
+@api_router.post("/chat/stream")
+async def chat_about_code_stream(request: dict):
+    """Stream /chat as Server-Sent Events.
+
+    Emits a `token` event for each piece of the answer as Gemini produces it, then
+    `done` with the same body /chat returns (or `error`). If the client goes away
+    the generation is cancelled, and the interaction is only logged once the
+    answer is complete.
+    """
+    session_id, message, context = validate_chat_request(request)
+    profile = await get_user_profile(session_id)
+    session = chat_sessions.get(session_id, context, reset=bool(request.get('reset')))
+    
+    async def events():
+        queue = asyncio.Queue()
+        
+        async def run():
+            try:
+                model = await get_gemini_model()
+                async with session.lock:
+                    bucket = chat_answer_bucket(session, profile, request)
+                    response = chat_answers.get(bucket, message) if bucket else None
+                    cached = response is not None
+                    if cached:
+                        queue.put_nowait(("token", {"text": response}))
+                    else:
+                        response = await stream_text(
+                            model,
+                            session.contents(message, profile),
+                            lambda text: queue.put_nowait(("token", {"text": text}))
+                        )
+                        if bucket:
+                            chat_answers.set(bucket, message, response)
+                    # A cancelled answer never reaches the history
+                    session.add_turn(message, response)
+                chat_sessions.schedule_compaction(session, model)
+                return response, cached
+            finally:
+                queue.put_nowait(None)
+        
+        generation_task = asyncio.create_task(run())
+        try:
+            while (event := await queue.get()) is not None:
+                yield format_sse(*event)
+            
+            response, cached = await generation_task
+            # Only queued for the profile flusher, so logging here doesn't delay `done`,
+            # and a client that leaves right after the last token is still counted
+            await record_chat_interaction(session_id, message, session.context, response)
+            yield format_sse("done", {
+                "session_id": session_id,
+                "message": message,
+                "response": response,
+                "skill_level": profile.skill_level,
+                "cached": cached,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        except QuotaExceeded as e:
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logging.error(f"Error in chat stream: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            # Stop paying for tokens if the client went away mid-answer
+            generation_task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def analyze_user_skill_level(session_id: str, interaction_data: dict, profile: UserProfile = None):
+    """Analyze user's skill level based on interactions, updating `profile` in place when given"""
     try:
         # Get user profile
-        profile = await get_user_profile(session_id)
+        profile = profile or await get_user_profile(session_id)
         
         # Analyze interaction complexity
         complexity_indicators = 0
@@ -464,46 +1925,51 @@ async def analyze_user_skill_level(session_id: str, interaction_data: dict):
                 profile.skill_level = "intermediate"
             else:
                 profile.skill_level = "beginner"
+            
+            # Save updated skill level
+            await update_user_profile_fields(session_id, {"skill_level": profile.skill_level})
         
-        # Save updated profile
-        await save_user_profile(profile)
         return profile.skill_level
         
     except Exception as e:
         logging.error(f"Error analyzing skill level: {str(e)}")
         return "beginner"  # Default fallback
 
+# Only the most recent interactions are kept on the profile
+INTERACTION_HISTORY_LIMIT = int(os.environ.get('INTERACTION_HISTORY_LIMIT', '200'))
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', '1024'))
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '30'))
+PROFILE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('PROFILE_FLUSH_INTERVAL_SECONDS', '2'))
+
+profile_store = ProfileStore(
+    db.user_profiles,
+    UserProfile,
+    PROFILE_CACHE_MAX_ENTRIES,
+    PROFILE_CACHE_TTL_SECONDS,
+    PROFILE_FLUSH_INTERVAL_SECONDS,
+    INTERACTION_HISTORY_LIMIT
+)
+
 async def get_user_profile(session_id: str) -> UserProfile:
     """Get or create user profile"""
     try:
-        profile_data = await db.user_profiles.find_one({"session_id": session_id})
-        if profile_data:
-            return UserProfile(**profile_data)
-        else:
-            # Create new profile
-            profile = UserProfile(session_id=session_id)
-            await save_user_profile(profile)
-            return profile
+        return await profile_store.get(session_id)
     except Exception as e:
         logging.error(f"Error getting user profile: {str(e)}")
         return UserProfile(session_id=session_id)
 
-async def save_user_profile(profile: UserProfile):
-    """Save user profile to database"""
-    try:
-        profile.last_updated = datetime.utcnow()
-        await db.user_profiles.replace_one(
-            {"session_id": profile.session_id},
-            profile.dict(),
-            upsert=True
-        )
-    except Exception as e:
-        logging.error(f"Error saving user profile: {str(e)}")
+async def update_user_profile_fields(session_id: str, fields: dict):
+    """Set individual profile fields without rewriting the rest of the document"""
+    profile_store.update_fields(session_id, fields)
+
+async def record_interaction(session_id: str, interaction: dict):
+    """Append an interaction to the profile's bounded history"""
+    profile_store.record_interaction(session_id, interaction)
 
-async def generate_personalized_suggestions(session_id: str, current_topic: str):
+async def generate_personalized_suggestions(session_id: str, current_topic: str, profile: UserProfile = None):
     """Generate personalized learning suggestions"""
     try:
-        profile = await get_user_profile(session_id)
+        profile = profile or await get_user_profile(session_id)
         model = await get_gemini_model()
         
         suggestions_prompt = f"""Based on this user profile, generate 3 personalized learning suggestions for the topic "{current_topic}":
@@ -518,19 +1984,16 @@ Generate suggestions that:
 3. Build on completed concepts
 4. Are practical and actionable
 
-Format as JSON array: ["suggestion 1", "suggestion 2", "suggestion 3"]"""
+Respond with a JSON object whose "suggestions" field is the list of suggestions."""
 
-        response_obj = await asyncio.to_thread(model.generate_content, suggestions_prompt)
-        
-        try:
-            import json
-            return json.loads(response_obj.text)
-        except Exception:
-            return [
+        generated = await generate_json_fields(model, suggestions_prompt, SUGGESTION_FIELDS, "suggestions")
+        if generated:
+            return generated["suggestions"]
+        return [
                 f"Practice more {current_topic} problems",
                 f"Learn advanced {current_topic} techniques",
                 f"Apply {current_topic} to real projects"
-            ]
+        ]
             
     except Exception as e:
         logging.error(f"Error generating suggestions: {str(e)}")
@@ -547,14 +2010,14 @@ async def update_learning_profile(request: dict):
         if not session_id:
             raise HTTPException(status_code=400, detail="Session ID is required")
         
-        # Analyze and update skill level
-        skill_level = await analyze_user_skill_level(session_id, interaction_data)
-        
-        # Get updated profile
+        # Read the profile once and share it across this request
         profile = await get_user_profile(session_id)
         
+        # Analyze and update skill level
+        skill_level = await analyze_user_skill_level(session_id, interaction_data, profile)
+        
         # Generate personalized suggestions
-        suggestions = await generate_personalized_suggestions(session_id, current_topic)
+        suggestions = await generate_personalized_suggestions(session_id, current_topic, profile)
         
         return {
             "session_id": session_id,
@@ -564,10 +2027,35 @@ async def update_learning_profile(request: dict):
             "completed_concepts": profile.completed_concepts
         }
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Error updating learning profile: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the result and profile caches and request coalescing of this worker"""
+    return {
+        **result_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "profiles": profile_store.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "chat_answers": chat_answers.stats(),
+        "images": image_dedupe_counters
+    }
+
+@api_router.get("/gemini/stats")
+async def get_gemini_stats():
+    """Queue depth and utilisation of the Gemini thread pool and job queue, and rate limiter state for this worker"""
+    return {
+        **gemini_executor.stats(),
+        "jobs": job_queue.stats(),
+        "rate_limiter": gemini_rate_limiter.stats(),
+        "json_parsing": json_parse_counters,
+        "flowcharts": flowchart_counters
+    }
+
 @api_router.get("/")
 async def root():
     return {"message": "AI Multimodal Coding Assistant API"}
@@ -575,6 +2063,14 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -590,6 +2086,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    indexes = [
+        # Let MongoDB expire shared cache entries on its own
+        (db.result_cache, "expires_at", {"expireAfterSeconds": 0}),
+        # Session history listing and pagination
+        (db.processing_results, [("session_id", 1), ("timestamp", -1), ("id", -1)], {}),
+        (db.processing_results, "id", {}),
+        (db.processing_result_bodies, [("result_id", 1), ("name", 1)], {}),
+        # Profile upserts rely on one document per session
+        (db.user_profiles, "session_id", {"unique": True}),
+        # Image re-upload lookups by exact digest, and by session and description for perceptual matches
+        (db.image_fingerprints, [("sha256", 1), ("description_key", 1), ("created_at", -1)], {}),
+        (db.image_fingerprints, [("session_id", 1), ("description_key", 1), ("created_at", -1)], {}),
+        # Job claims scan by status and availability; finished jobs expire after JOB_RETENTION_SECONDS
+        (db.processing_jobs, [("status", 1), ("available_at", 1)], {}),
+        (db.processing_jobs, "expires_at", {"expireAfterSeconds": 0}),
+    ]
+    # Indexes are created independently so one failure doesn't leave the rest missing
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            logging.error(f"Error creating index {keys} on {collection.name}: {str(e)}")
+
+@app.on_event("startup")
+async def start_profile_flusher():
+    profile_store.start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await job_queue.stop(JOB_DRAIN_TIMEOUT_SECONDS)
+    await profile_store.stop()
+    client.close()
+    gemini_executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""Deterministic code analysis of Python source using the standard library's ast.
+
+Estimates Big-O from loop nesting, halving loops, recursion and the cost of
+common built-ins, and scores quality from cyclomatic complexity and function
+length. Used as a fast first answer and as a fallback when Gemini is unavailable.
+"""
+import ast
+from typing import Optional, Tuple
+
+# Thresholds for the local static analyzer
+STATIC_COMPLEXITY_WARNING = 10
+STATIC_FUNCTION_LINES_WARNING = 50
+# Same cap the server applies to merged chunk analyses
+STATIC_SUGGESTIONS_LIMIT = 5
+
+# Built-ins that walk their whole (single) iterable argument
+LINEAR_BUILTINS = ("sum", "min", "max", "any", "all", "list", "tuple", "set", "frozenset", "dict")
+# Methods that scan the sequence they're called on
+LINEAR_METHODS = ("index", "count")
+COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+def big_o(power: int, log: int = 0) -> str:
+    """O(n^power log^log n) in the notation the model uses, e.g. O(n log n)"""
+    terms = []
+    if power:
+        terms.append("n" if power == 1 else f"n^{power}")
+    if log:
+        terms.append("log n" if log == 1 else f"log^{log} n")
+    return f"O({' '.join(terms) or '1'})"
+
+def is_halving(node) -> bool:
+    """`x // 2`, `x / 2`, `x >> 1` and their augmented forms"""
+    if isinstance(node, (ast.BinOp, ast.AugAssign)) and isinstance(node.op, (ast.FloorDiv, ast.Div, ast.RShift)):
+        operand = node.right if isinstance(node, ast.BinOp) else node.value
+        return isinstance(operand, ast.Constant) and operand.value == (1 if isinstance(node.op, ast.RShift) else 2)
+    return False
+
+def halved_names(node) -> set:
+    """Names assigned a halved value inside `node`, directly or through other assignments.
+
+    `mid = (low + high) // 2; low = mid + 1` makes both `mid` and `low` halved;
+    an average computed along the way (`avg = total / 2`) only taints `avg`.
+    """
+    assignments = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Assign):
+            assignments.append((child.targets, child.value, False))
+        elif isinstance(child, ast.AugAssign):
+            assignments.append(([child.target], child.value, is_halving(child)))
+    halved, changed = set(), True
+    while changed:
+        changed = False
+        for targets, value, augmented_halving in assignments:
+            if augmented_halving or depends_on_halving(value, halved):
+                for target in targets:
+                    for name in ast.walk(target):
+                        if isinstance(name, ast.Name) and name.id not in halved:
+                            halved.add(name.id)
+                            changed = True
+    return halved
+
+def depends_on_halving(node, halved: set) -> bool:
+    return any(is_halving(part) or (isinstance(part, ast.Name) and part.id in halved) for part in ast.walk(node))
+
+def is_halving_loop(node: ast.While) -> bool:
+    """Whether a while loop's condition depends on a value halved in its body (binary search, bit shifting)"""
+    halved = halved_names(node)
+    return any(isinstance(name, ast.Name) and name.id in halved for name in ast.walk(node.test))
+
+def is_copying_slice(node) -> bool:
+    """A slice running to an end of the sequence, which copies O(n) items (`a[mid:]`, `a[::-1]`)"""
+    if not isinstance(node, ast.Slice) or (node.lower and node.upper):
+        return False
+    bound = node.lower or node.upper
+    return not isinstance(bound, (ast.Constant, ast.UnaryOp))
+
+def is_list_annotation(annotation) -> bool:
+    target = annotation.value if isinstance(annotation, ast.Subscript) else annotation
+    return getattr(target, "id", None) in ("list", "List")
+
+def call_cost(node: ast.Call) -> Optional[Tuple[int, int]]:
+    """(power of n, power of log n) a call adds on top of the loops around it, or None if O(1)"""
+    name = node.func.id if isinstance(node.func, ast.Name) else None
+    method = node.func.attr if isinstance(node.func, ast.Attribute) else None
+    if name == "sorted" or method == "sort":
+        return (1, 1)
+    # A comprehension argument is costed as a loop of its own
+    iterates = len(node.args) == 1 and not isinstance(node.args[0], COMPREHENSIONS)
+    if (name in LINEAR_BUILTINS or method == "join") and iterates:
+        return (1, 0)
+    if method in LINEAR_METHODS:
+        return (1, 0)
+    return None
+
+class FunctionMetricsVisitor(ast.NodeVisitor):
+    """Collect loop nesting, cost, cyclomatic complexity, self-calls and growth of one scope.
+
+    Nested functions and classes are separate scopes and are not descended into.
+    """
+
+    def __init__(self, name: str = None, list_names: set = None):
+        self.name = name
+        self.loop_depth = 0
+        self.max_loop_depth = 0
+        self.linear_loops = 0
+        self.halving_loops = 0
+        self.cost = (0, 0)  # (power of n, power of log n) of the most expensive point in the scope
+        self.complexity = 1
+        self.self_calls = 0
+        self.returned_self_calls = 0  # self-calls that are the whole return value, of which only one runs per call
+        self.returned_call = None
+        self.self_call_nodes = []
+        self.grows_collection = False
+        self.list_names = set(list_names or ())  # names known to hold lists, where `in` is a scan
+        self.costly_calls_in_loops = []
+
+    def charge(self, power: int = 0, log: int = 0, label: str = None):
+        self.cost = max(self.cost, (self.linear_loops + power, self.halving_loops + log))
+        if label and self.loop_depth and label not in self.costly_calls_in_loops:
+            self.costly_calls_in_loops.append(label)
+
+    def visit_FunctionDef(self, node):
+        pass
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+    visit_Lambda = visit_FunctionDef
+
+    def visit_loop(self, node):
+        # A while loop that halves what it tests runs O(log n) times
+        halving = isinstance(node, ast.While) and is_halving_loop(node)
+        self.complexity += 1
+        self.loop_depth += 1
+        self.max_loop_depth = max(self.max_loop_depth, self.loop_depth)
+        if halving:
+            self.halving_loops += 1
+        else:
+            self.linear_loops += 1
+        self.charge()
+        self.generic_visit(node)
+        if halving:
+            self.halving_loops -= 1
+        else:
+            self.linear_loops -= 1
+        self.loop_depth -= 1
+
+    visit_For = visit_loop
+    visit_AsyncFor = visit_loop
+    visit_While = visit_loop
+
+    def visit_comprehension_node(self, node):
+        self.grows_collection = True
+        self.complexity += sum(len(generator.ifs) for generator in node.generators)
+        self.loop_depth += len(node.generators)
+        self.linear_loops += len(node.generators)
+        self.max_loop_depth = max(self.max_loop_depth, self.loop_depth)
+        self.charge()
+        self.generic_visit(node)
+        self.linear_loops -= len(node.generators)
+        self.loop_depth -= len(node.generators)
+
+    visit_ListComp = visit_comprehension_node
+    visit_SetComp = visit_comprehension_node
+    visit_DictComp = visit_comprehension_node
+    visit_GeneratorExp = visit_comprehension_node
+
+    def visit_branch(self, node):
+        self.complexity += 1
+        self.generic_visit(node)
+
+    visit_If = visit_branch
+    visit_IfExp = visit_branch
+    visit_ExceptHandler = visit_branch
+    visit_Assert = visit_branch
+    visit_match_case = visit_branch
+
+    def visit_BoolOp(self, node):
+        self.complexity += len(node.values) - 1
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        if is_copying_slice(node.slice):
+            self.charge(1, 0, "slicing")
+        self.generic_visit(node)
+
+    def is_list(self, node) -> bool:
+        """Whether an expression evaluates to a list of unbounded size"""
+        if isinstance(node, ast.Name):
+            return node.id in self.list_names
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            return node.func.id in ("list", "sorted")
+        return isinstance(node, ast.ListComp)
+
+    def visit_Compare(self, node):
+        # `in` on a literal like [1, 2, 3] is bounded; on a list that can grow it's a scan
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)) and self.is_list(comparator):
+                self.charge(1, 0, "`in` on a list")
+        self.generic_visit(node)
+
+    def track_assignment(self, targets, value):
+        for target in targets:
+            if isinstance(target, ast.Name):
+                if value is not None and (isinstance(value, ast.List) or self.is_list(value)):
+                    self.list_names.add(target.id)
+                else:
+                    self.list_names.discard(target.id)
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        self.track_assignment(node.targets, node.value)
+
+    def visit_AnnAssign(self, node):
+        self.generic_visit(node)
+        if is_list_annotation(node.annotation):
+            self.list_names.add(getattr(node.target, "id", None))
+        else:
+            self.track_assignment([node.target], node.value)
+
+    def visit_Return(self, node):
+        self.returned_call = node.value
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if self.name and (
+            (isinstance(func, ast.Name) and func.id == self.name)
+            or (isinstance(func, ast.Attribute) and func.attr == self.name
+                and isinstance(func.value, ast.Name) and func.value.id in ("self", "cls"))
+        ):
+            self.self_calls += 1
+            self.self_call_nodes.append(node)
+            if node is self.returned_call:
+                self.returned_self_calls += 1
+        if self.loop_depth and isinstance(func, ast.Attribute) and func.attr in ("append", "add", "extend", "insert", "update"):
+            self.grows_collection = True
+        cost = call_cost(node)
+        if cost:
+            self.charge(*cost, f"{getattr(func, 'id', None) or getattr(func, 'attr', '')}()")
+        self.generic_visit(node)
+
+def decorator_name(decorator) -> str:
+    """`cache` for @cache, @functools.cache and @lru_cache(...)-style decorators alike"""
+    target = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return getattr(target, "attr", None) or getattr(target, "id", "")
+
+def measure_scope(node, name: str = None) -> FunctionMetricsVisitor:
+    list_names = set()
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        list_names = {arg.arg for arg in node.args.args if arg.annotation is not None and is_list_annotation(arg.annotation)}
+    visitor = FunctionMetricsVisitor(name, list_names)
+    for child in (node.body if hasattr(node, "body") else [node]):
+        visitor.visit(child)
+    return visitor
+
+def recursive_cost(function: dict) -> Tuple[int, int, int]:
+    """(exponential, power of n, power of log n) for a function's recursion on top of its own work"""
+    power, log = function["cost"]
+    if function["halves"]:
+        if function["self_calls"] >= 2:
+            # Divide and conquer: every level of the log n deep call tree does O(n) work in total
+            return (0, max(power, 1), log + 1 if power else log)
+        return (0, power, log + 1)
+    if function["self_calls"] >= 2 and not function["memoized"]:
+        return (1, 0, 0)
+    return (0, power + 1, log)
+
+def analyze_python_statically(code: str) -> Optional[dict]:
+    """Deterministic code_analysis for Python source, or None if it doesn't parse.
+
+    Big-O is estimated from loop nesting, loops and recursion that halve their
+    input, and the cost of common built-ins (sorted() is O(n log n); sum(), min(),
+    list() and `in` on a known list are O(n)). Types aren't inferred, so calls on
+    user-defined objects count as O(1) and the result is an estimate, not a proof.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    functions = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        metrics = measure_scope(node, node.name)
+        memoized = any(decorator_name(decorator) in ("lru_cache", "cache") for decorator in node.decorator_list)
+        functions.append({
+            "name": node.name,
+            "lines": (node.end_lineno or node.lineno) - node.lineno + 1,
+            "cyclomatic_complexity": metrics.complexity,
+            "max_loop_depth": metrics.max_loop_depth,
+            "cost": metrics.cost,
+            "costly_calls_in_loops": metrics.costly_calls_in_loops,
+            "recursive": metrics.self_calls > 0,
+            # `return f(a)` on one branch and `return f(b)` on another still recurse once per call
+            "self_calls": metrics.self_calls - metrics.returned_self_calls + min(metrics.returned_self_calls, 1),
+            # Recursing on a halved range (binary search, merge sort) is log n deep
+            "halves": any(
+                depends_on_halving(argument, halved_names(node))
+                for call in metrics.self_call_nodes for argument in [*call.args, *(keyword.value for keyword in call.keywords)]
+            ),
+            "memoized": memoized,
+            "grows_collection": metrics.grows_collection
+        })
+    module = measure_scope(tree)
+
+    # Time: the most expensive point in any scope, or what recursion implies on top of the function's own work
+    time_estimates = [(0, *module.cost), *((0, *function["cost"]) for function in functions)]
+    time_estimates.extend(recursive_cost(function) for function in functions if function["recursive"])
+    exponential, power, log = max(time_estimates)
+    time_complexity = "O(2^n)" if exponential else big_o(power, log)
+
+    # Space: recursion depth and collections built in loops or comprehensions
+    recursive = [function for function in functions if function["recursive"]]
+    grows = module.grows_collection or any(function["grows_collection"] for function in functions)
+    if grows or any(not function["halves"] for function in recursive):
+        space_complexity = "O(n)"
+    else:
+        space_complexity = "O(log n)" if recursive else "O(1)"
+
+    complex_functions = [function for function in functions if function["cyclomatic_complexity"] > STATIC_COMPLEXITY_WARNING]
+    long_functions = [function for function in functions if function["lines"] > STATIC_FUNCTION_LINES_WARNING]
+    quality_score = 10 - 2 * len(complex_functions) - len(long_functions)
+    quality_score -= sum(1 for function in functions if 5 < function["cyclomatic_complexity"] <= STATIC_COMPLEXITY_WARNING)
+    max_loop_depth = max([module.max_loop_depth, *(function["max_loop_depth"] for function in functions)])
+    if max_loop_depth >= 2:
+        quality_score -= 1
+
+    optimizations, alternatives, learning_insights = [], [], []
+    if max_loop_depth >= 2:
+        optimizations.append(f"Loops are nested {max_loop_depth} deep; a hash map, set or sorting step can often remove a level")
+        alternatives.append("Sort first or index values in a dict/set to avoid comparing every pair")
+        learning_insights.append(f"{max_loop_depth} nested loops over n items take roughly n^{max_loop_depth} steps")
+    for scope_name, costly_calls in [("module", module.costly_calls_in_loops), *((function["name"], function["costly_calls_in_loops"]) for function in functions)]:
+        if costly_calls:
+            optimizations.append(f"{', '.join(costly_calls)} inside a loop in {scope_name} costs O(n) or more per iteration; hoist it out or use a set/dict")
+    for function in recursive:
+        if function["self_calls"] >= 2 and not function["memoized"] and not function["halves"]:
+            optimizations.append(f"{function['name']} calls itself {function['self_calls']} times per call; memoize it with functools.lru_cache")
+            alternatives.append(f"Rewrite {function['name']} bottom-up with dynamic programming")
+        else:
+            alternatives.append(f"Rewrite {function['name']} iteratively to avoid recursion depth limits")
+        learning_insights.append(f"Each recursive call to {function['name']} adds a stack frame, so recursion depth costs memory")
+    for function in complex_functions:
+        optimizations.append(f"Split {function['name']} (cyclomatic complexity {function['cyclomatic_complexity']}) into smaller functions")
+    for function in long_functions:
+        optimizations.append(f"{function['name']} is {function['lines']} lines long; extract helpers to make it easier to test")
+
+    optimizations = optimizations or ["No structural hotspots found; profile with real inputs before optimizing"]
+    alternatives = alternatives or ["Check whether a built-in (sorted, sum, collections.Counter) already does this"]
+    learning_insights.append("Cyclomatic complexity counts independent paths through a function; under 10 keeps it easy to test")
+
+    return {
+        "time_complexity": time_complexity,
+        "space_complexity": space_complexity,
+        "quality_score": max(1, min(10, quality_score)),
+        "optimizations": optimizations[:STATIC_SUGGESTIONS_LIMIT],
+        "alternatives": alternatives[:STATIC_SUGGESTIONS_LIMIT],
+        "learning_insights": learning_insights[:STATIC_SUGGESTIONS_LIMIT],
+        "analysis_source": "static",
+        "static_analysis": {
+            "max_loop_depth": max_loop_depth,
+            "functions": [
+                {key: function[key] for key in ("name", "lines", "cyclomatic_complexity", "max_loop_depth", "recursive")}
+                for function in functions
+            ]
+        }
+    }
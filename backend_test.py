@@ -208,6 +208,41 @@ def test_session_endpoint():
         print(f"❌ Session endpoint test failed: {str(e)}")
         return False
 
+def test_session_endpoint_pagination():
+    """Test cursor pagination and the summary projection of the /session/{session_id} endpoint"""
+    print("\n=== Testing Session Endpoint Pagination ===")
+    try:
+        response = requests.get(f"{API_URL}/session/{TEST_SESSION_ID}", params={"limit": 1, "fields": "summary"})
+        print(f"Status Code: {response.status_code}")
+        
+        if response.status_code != 200:
+            print(f"Error response: {response.text}")
+            return False
+        
+        result = response.json()
+        assert "next_cursor" in result, "Response should contain 'next_cursor' field"
+        assert len(result["results"]) <= 1, "Results should respect the limit"
+        for item in result["results"]:
+            assert "code_outputs" not in item, "Summary results should not contain 'code_outputs'"
+        
+        if result["next_cursor"]:
+            next_response = requests.get(
+                f"{API_URL}/session/{TEST_SESSION_ID}",
+                params={"limit": 1, "fields": "summary", "cursor": result["next_cursor"]}
+            )
+            assert next_response.status_code == 200, f"Expected status code 200, got {next_response.status_code}"
+            next_results = next_response.json()["results"]
+            assert not next_results or next_results[0]["id"] != result["results"][0]["id"], "Next page should not repeat results"
+        
+        invalid_response = requests.get(f"{API_URL}/session/{TEST_SESSION_ID}", params={"cursor": "not-a-cursor"})
+        assert invalid_response.status_code == 400, f"Expected status code 400 for invalid cursor, got {invalid_response.status_code}"
+        
+        print("\n✅ Session endpoint pagination test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Session endpoint pagination test failed: {str(e)}")
+        return False
+
 def test_analyze_code_endpoint():
     """Test the new /analyze-code endpoint for instant code analysis"""
     print("\n=== Testing Analyze Code Endpoint ===")
@@ -921,6 +956,213 @@ def test_process_image_endpoint():
             os.remove("test_image.png")
         return False
 
+def test_process_stream_endpoint():
+    """Test the /process/stream endpoint emits SSE events ending with the persisted result id"""
+    print("\n=== Testing Process Stream Endpoint ===")
+    try:
+        payload = {
+            "session_id": TEST_SESSION_ID,
+            "input_type": "text",
+            "content": "sort an array using bubble sort",
+            "languages": ["python"]
+        }
+        
+        response = requests.post(f"{API_URL}/process/stream", json=payload, stream=True)
+        print(f"Status Code: {response.status_code}")
+        
+        assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+        assert response.headers.get("content-type", "").startswith("text/event-stream"), "Response should be an event stream"
+        
+        events = []
+        event_name = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event_name = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event_name, json.loads(line[len("data: "):])))
+        
+        print(f"Received {len(events)} events")
+        assert events, "Stream should contain events"
+        
+        last_event, last_data = events[-1]
+        assert last_event == "done", f"Last event should be 'done', got {last_event}: {last_data}"
+        assert "id" in last_data, "Done event should contain the persisted result id"
+        
+        stages = [data["stage"] for name, data in events if name == "stage"]
+        assert "pseudocode" in stages, "Stream should report the pseudocode stage"
+        assert "python" in stages, "Stream should report the requested python stage"
+        
+        print("\n✅ Process stream endpoint test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Process stream endpoint test failed: {str(e)}")
+        return False
+
+def test_process_batch_endpoint():
+    """Test /process-batch dedupes identical items and reports per-item errors"""
+    print("\n=== Testing Process Batch Endpoint ===")
+    try:
+        item = {
+            "session_id": TEST_SESSION_ID,
+            "input_type": "text",
+            "content": "reverse a string",
+            "languages": ["python"]
+        }
+        payload = {"items": [item, dict(item), {**item, "languages": ["cobol"]}]}
+        
+        response = requests.post(f"{API_URL}/process-batch", json=payload)
+        print(f"Status Code: {response.status_code}")
+        
+        assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+        result = response.json()
+        assert result["unique_items"] == 2, f"Identical items should be generated once, got {result['unique_items']} generations"
+        
+        items = sorted(result["results"], key=lambda entry: entry["index"])
+        assert len(items) == 3, "Every item should have a result entry"
+        if items[0]["status_code"] == 429:
+            print("⚠️ Rate limit exceeded. This is expected in a test environment.")
+        else:
+            assert items[0]["result"] and items[1]["result"], "Identical items should both succeed"
+            assert items[0]["result"]["id"] != items[1]["result"]["id"], "Each item should be stored as its own result"
+        assert items[2]["status_code"] == 400, "An unsupported language should fail only its own item"
+        
+        print("\n✅ Process batch endpoint test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Process batch endpoint test failed: {str(e)}")
+        return False
+
+def test_process_job_endpoint():
+    """Test /process?mode=job answers 202 and the job can be polled to completion"""
+    print("\n=== Testing Process Job Endpoint ===")
+    try:
+        payload = {
+            "session_id": TEST_SESSION_ID,
+            "input_type": "text",
+            "content": "check whether a number is prime",
+            "languages": ["python"]
+        }
+        
+        response = requests.post(f"{API_URL}/process", params={"mode": "job"}, json=payload)
+        print(f"Status Code: {response.status_code}")
+        
+        assert response.status_code == 202, f"Expected status code 202, got {response.status_code}"
+        job_id = response.json()["job_id"]
+        
+        job = None
+        for _ in range(60):
+            job = requests.get(f"{API_URL}/jobs/{job_id}").json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(2)
+        
+        print(f"Job status: {job['status']} after {job['attempts']} attempt(s)")
+        assert job["status"] == "succeeded", f"Job should succeed, got {job['status']}: {job.get('error')}"
+        assert job["result"]["id"] == job["result_id"], "Job should include its stored result"
+        assert "python" in job["result"]["code_outputs"], "Result should contain the requested language"
+        
+        missing_response = requests.get(f"{API_URL}/jobs/not-a-job")
+        assert missing_response.status_code == 404, f"Expected status code 404 for an unknown job, got {missing_response.status_code}"
+        
+        print("\n✅ Process job endpoint test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Process job endpoint test failed: {str(e)}")
+        return False
+
+def test_chat_stream_endpoint():
+    """Test /chat/stream forwards tokens as SSE and ends with the full response"""
+    print("\n=== Testing Chat Stream Endpoint ===")
+    try:
+        payload = {
+            "session_id": TEST_SESSION_ID,
+            "message": "Why is bubble sort O(n^2)?",
+            "context": {"code": "def bubble_sort(arr):\n    for i in range(len(arr)):\n        for j in range(len(arr) - i - 1):\n            pass"}
+        }
+        
+        response = requests.post(f"{API_URL}/chat/stream", json=payload, stream=True)
+        print(f"Status Code: {response.status_code}")
+        
+        assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+        assert response.headers.get("content-type", "").startswith("text/event-stream"), "Response should be an event stream"
+        
+        events = []
+        event_name = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event_name = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event_name, json.loads(line[len("data: "):])))
+        
+        last_event, last_data = events[-1]
+        assert last_event == "done", f"Last event should be 'done', got {last_event}: {last_data}"
+        tokens = "".join(data["text"] for name, data in events if name == "token")
+        assert tokens and tokens == last_data["response"], "Tokens should add up to the final response"
+        
+        missing_response = requests.post(f"{API_URL}/chat/stream", json={"session_id": TEST_SESSION_ID})
+        assert missing_response.status_code == 400, f"Expected status code 400 without a message, got {missing_response.status_code}"
+        
+        print("\n✅ Chat stream endpoint test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Chat stream endpoint test failed: {str(e)}")
+        return False
+
+def test_chat_session_followup():
+    """Test a follow-up /chat message without context continues the server-side session"""
+    print("\n=== Testing Chat Session Follow-up ===")
+    try:
+        session_id = f"chat_session_{int(time.time())}"
+        first = {
+            "session_id": session_id,
+            "message": "What does this function return?",
+            "context": {"code": "def square(x):\n    return x * x"}
+        }
+        response = requests.post(f"{API_URL}/chat", json=first)
+        assert response.status_code == 200, f"Expected status code 200, got {response.status_code}"
+        
+        resumed_before = requests.get(f"{API_URL}/cache/stats").json()["chat_sessions"]["resumed"]
+        followup = requests.post(f"{API_URL}/chat", json={"session_id": session_id, "message": "And for a negative input?"})
+        assert followup.status_code == 200, f"Expected status code 200, got {followup.status_code}"
+        assert followup.json()["response"], "Follow-up should get an answer"
+        
+        resumed_after = requests.get(f"{API_URL}/cache/stats").json()["chat_sessions"]["resumed"]
+        assert resumed_after > resumed_before, "Follow-up should resume the live chat session"
+        
+        print("\n✅ Chat session follow-up test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Chat session follow-up test failed: {str(e)}")
+        return False
+
+def test_chat_answer_cache():
+    """Test a near-duplicate first question about the same code is answered from the cache"""
+    print("\n=== Testing Chat Answer Cache ===")
+    try:
+        context = {"code": "def bubble_sort(arr):\n    for i in range(len(arr)):\n        for j in range(len(arr) - i - 1):\n            if arr[j] > arr[j + 1]:\n                arr[j], arr[j + 1] = arr[j + 1], arr[j]"}
+        first = requests.post(f"{API_URL}/chat", json={
+            "session_id": f"answer_cache_a_{int(time.time())}",
+            "message": "What's the time complexity of this bubble sort?",
+            "context": context
+        })
+        assert first.status_code == 200, f"Expected status code 200, got {first.status_code}"
+        
+        # A different learner asking the same thing in other words, at the same (default) skill level
+        second = requests.post(f"{API_URL}/chat", json={
+            "session_id": f"answer_cache_b_{int(time.time())}",
+            "message": "what is the time complexity of this bubble sort algorithm",
+            "context": context
+        })
+        assert second.status_code == 200, f"Expected status code 200, got {second.status_code}"
+        assert second.json()["cached"], "Near-duplicate question should be served from the cache"
+        assert second.json()["response"] == first.json()["response"], "Cached answer should match the original"
+        
+        print("\n✅ Chat answer cache test passed")
+        return True
+    except Exception as e:
+        print(f"❌ Chat answer cache test failed: {str(e)}")
+        return False
+
 def run_all_tests():
     """Run all tests and return overall status"""
     print("\n=== Running All Backend Tests ===")
@@ -935,6 +1177,13 @@ def run_all_tests():
         ("Chat Endpoint Error Handling", test_chat_endpoint_error_handling),
         ("Learning Profile Endpoint", test_learning_profile_endpoint),  # NEW: Personalized learning engine test
         ("Enhanced Chat with Skill Adaptation", test_enhanced_chat_endpoint_with_skill_adaptation),  # NEW: Enhanced chat test
+        ("Session Endpoint Pagination", test_session_endpoint_pagination),
+        ("Process Stream Endpoint", test_process_stream_endpoint),
+        ("Process Batch Endpoint", test_process_batch_endpoint),
+        ("Process Job Endpoint", test_process_job_endpoint),
+        ("Chat Stream Endpoint", test_chat_stream_endpoint),
+        ("Chat Session Follow-up", test_chat_session_followup),
+        ("Chat Answer Cache", test_chat_answer_cache),
         # Add a delay between API calls to avoid rate limits
         # We'll only test the core endpoints to avoid hitting rate limits
         # ("Session Endpoint", test_session_endpoint),
@@ -0,0 +1,60 @@
+"""Shared test setup: backend modules on the import path and a MongoDB collection fixture"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# The store and queue tests run against this MongoDB, or in memory through mongomock-motor when it isn't up
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL", "mongodb://localhost:27017")
+MONGO_TEST_DB = os.environ.get("MONGO_TEST_DB", "codeweaver_tests")
+
+def local_mongo_available() -> bool:
+    try:
+        import pymongo
+    except ImportError:
+        return False
+    client = pymongo.MongoClient(MONGO_TEST_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+        return True
+    except Exception:
+        return False
+    finally:
+        client.close()
+
+@pytest.fixture(scope="session")
+def mongo_backend() -> str:
+    if local_mongo_available():
+        pytest.importorskip("motor")
+        return "mongod"
+    pytest.importorskip("mongomock_motor", reason="needs a local mongod or mongomock-motor")
+    return "mongomock"
+
+@pytest.fixture
+def mongo_collection(mongo_backend):
+    """Opens a fresh, uniquely named collection; call it inside the test's event loop"""
+    name = f"test_{uuid.uuid4().hex}"
+    clients = []
+
+    def open_collection():
+        if clients:
+            return clients[0][MONGO_TEST_DB][name]
+        if mongo_backend == "mongod":
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(MONGO_TEST_URL)
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            client = AsyncMongoMockClient()
+        clients.append(client)
+        return client[MONGO_TEST_DB][name]
+
+    yield open_collection
+
+    if mongo_backend == "mongod":
+        import pymongo
+        with pymongo.MongoClient(MONGO_TEST_URL) as client:
+            client[MONGO_TEST_DB].drop_collection(name)
@@ -0,0 +1,120 @@
+"""Tests for the two-tier result cache and single-flight coalescing"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from caching import ResultCache, SingleFlight
+
+def test_value_is_shared_with_other_workers_through_mongo(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        writer, reader = ResultCache(collection, 8, 3600), ResultCache(collection, 8, 3600)
+        await writer.set("key", "process", {"code": {"python": "pass"}})
+
+        assert await writer.get("key") == {"code": {"python": "pass"}}
+        assert await reader.get("key") == {"code": {"python": "pass"}}
+        assert await reader.get("key") == {"code": {"python": "pass"}}
+        assert (writer.counters["memory_hits"], reader.counters["mongo_hits"], reader.counters["memory_hits"]) == (1, 1, 1)
+
+    asyncio.run(scenario())
+
+def test_returned_values_are_copies(mongo_collection):
+    async def scenario():
+        cache = ResultCache(mongo_collection(), 8, 3600)
+        await cache.set("key", "process", {"items": [1]})
+        (await cache.get("key"))["items"].append(2)
+        assert await cache.get("key") == {"items": [1]}
+
+    asyncio.run(scenario())
+
+def test_expired_documents_are_misses(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        await collection.insert_one({"_id": "key", "kind": "process", "value": {"a": 1}, "expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        cache = ResultCache(collection, 8, 3600)
+        assert await cache.get("key") is None
+        assert cache.counters["misses"] == 1
+
+    asyncio.run(scenario())
+
+def test_memory_copy_of_a_mongo_hit_expires_with_the_shared_entry(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        await collection.insert_one({"_id": "key", "kind": "process", "value": {"a": 1}, "expires_at": datetime.utcnow() + timedelta(seconds=0.2)})
+        cache = ResultCache(collection, 8, 3600)
+        assert await cache.get("key") == {"a": 1}
+        assert cache.entries["key"][0] - time.monotonic() < 1
+        await asyncio.sleep(0.3)
+        assert await cache.get("key") is None
+
+    asyncio.run(scenario())
+
+def test_memory_tier_evicts_least_recently_used(mongo_collection):
+    async def scenario():
+        cache = ResultCache(mongo_collection(), 2, 3600)
+        for key in ("a", "b", "c"):
+            await cache.set(key, "process", {"key": key})
+        assert list(cache.entries) == ["b", "c"]
+        # Still served by MongoDB
+        assert await cache.get("a") == {"key": "a"}
+        assert cache.counters["mongo_hits"] == 1
+
+    asyncio.run(scenario())
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"items": []}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+        results[0]["items"].append(1)
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results[1:] == [{"items": []}] * 4
+    assert (flight.counters, flight.in_flight) == ({"leaders": 1, "coalesced": 4}, {})
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.create_task(flight.run("key", work))
+        follower = asyncio.create_task(flight.run("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
+
+def test_failure_reaches_every_caller_and_clears_the_key():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Gemini unavailable")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.in_flight == {}
+
+    async def retry():
+        return await flight.run("key", lambda: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(retry()) == "ok"
+    with pytest.raises(RuntimeError):
+        asyncio.run(flight.run("key", work))
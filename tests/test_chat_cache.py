@@ -0,0 +1,45 @@
+"""Tests for matching near-duplicate chat questions"""
+import pytest
+
+from chat_cache import ChatAnswerCache, normalize_question
+
+def make_cache():
+    return ChatAnswerCache(max_entries=100, ttl_seconds=60, threshold=0.8, bands=16, rows=4)
+
+@pytest.mark.parametrize("asked, repeated", [
+    ("What's the time complexity?", "what is the time complexity of this?"),
+    ("Can you please explain how this loop works?", "Explain how my loop works"),
+    ("Why is my function slow?", "why is this function slow"),
+    ("Why does it crash when the input list is empty and n is negative?",
+     "Why does this crash when the input list is empty and n is negative?"),
+])
+def test_rephrased_questions_share_an_answer(asked, repeated):
+    cache = make_cache()
+    cache.set("bucket", asked, "answer")
+    assert cache.get("bucket", repeated) == "answer"
+
+@pytest.mark.parametrize("asked, other", [
+    ("Is this O(n)?", "What is O(n)?"),
+    ("Why is this slow?", "How is this slow?"),
+    ("Does this handle empty lists?", "Doesn't this handle empty lists?"),
+    ("Is this recursive?", "Is this not recursive?"),
+    ("What does this return?", "Why does this return?"),
+    # One word that changes the meaning of an otherwise identical long question
+    ("How do I reverse a linked list in Python?", "How do I reverse a linked list in Java?"),
+    ("Why does this loop run forever when n is negative?", "Why does this loop run forever when n is zero?"),
+    ("How would I sort this list of records in ascending order?", "How would I sort this list of records in descending order?"),
+])
+def test_different_questions_do_not_match(asked, other):
+    cache = make_cache()
+    cache.set("bucket", asked, "answer")
+    assert cache.get("bucket", other) is None
+
+def test_question_words_and_negations_survive_normalisation():
+    assert normalize_question("Is this O(n)?") == "is o(n)"
+    assert normalize_question("What is O(n)?") == "what is o(n)"
+    assert normalize_question("Doesn't it sort?") == "does not it sort"
+
+def test_answers_are_not_shared_across_buckets():
+    cache = make_cache()
+    cache.set("code-a:beginner", "What is the time complexity?", "answer")
+    assert cache.get("code-b:beginner", "What is the time complexity?") is None
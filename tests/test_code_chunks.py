@@ -0,0 +1,56 @@
+"""Tests for chunking large code files and ranking Big-O answers"""
+import pytest
+
+from code_chunks import complexity_rank, split_code_into_chunks
+
+def test_small_code_is_one_chunk():
+    assert split_code_into_chunks("x = 1\n", 1000) == ["x = 1\n"]
+
+def test_definitions_are_packed_up_to_the_limit():
+    functions = [f"def f{index}():\n    return {index}\n" for index in range(20)]
+    chunks = split_code_into_chunks("\n".join(functions), 100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.lstrip().startswith("def f") for chunk in chunks)
+    assert "".join(chunks).count("def f") == 20
+
+def test_one_long_line_is_split_by_characters():
+    line = ";".join(f"var a{index}=function(){{return {index}}}" for index in range(200))
+    assert len(line) > 5000
+    chunks = split_code_into_chunks(line, 1000)
+    assert len(chunks) > 5
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert "".join(chunks) == line
+    # Cuts land after a statement separator rather than mid-token
+    assert all(chunk.endswith(";") for chunk in chunks[:-1])
+
+def test_long_line_inside_a_definition_is_split():
+    code = "def f():\n    data = [" + ", ".join(str(index) for index in range(2000)) + "]\n    return data\n"
+    chunks = split_code_into_chunks(code, 1000)
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+
+@pytest.mark.parametrize("cheaper, costlier", [
+    ("O(1)", "O(log n)"),
+    ("O(log n)", "O(sqrt(n))"),
+    ("O(√n)", "O(n)"),
+    ("O(n)", "O(n log n)"),
+    ("O(n log(n))", "O(n^2)"),
+    ("O(n²)", "O(n^3)"),
+    ("O(n^3)", "O(2^n)"),
+    ("O(2^n)", "O(n!)"),
+    ("O(1)", "O(V + E)"),
+    ("O(n)", "O(n*m)"),
+    ("O(n + m)", "O(n * m)"),
+    ("O(log log n)", "O(n)"),
+    ("Analysis pending", "O(1)"),
+    ("O(n log n)", "O(n) on average, O(n^2) in the worst case"),
+])
+def test_complexity_rank_orders_classes(cheaper, costlier):
+    assert complexity_rank(cheaper) < complexity_rank(costlier)
+
+@pytest.mark.parametrize("first, second", [
+    ("O(n)", "O(V + E)"),
+    ("O(n^2)", "O(n * m)"),
+    ("O(n log n)", "O(N log N)"),
+])
+def test_complexity_rank_equivalent_forms(first, second):
+    assert complexity_rank(first) == complexity_rank(second)
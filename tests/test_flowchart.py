@@ -0,0 +1,261 @@
+"""Corpus tests for the local pseudocode -> Mermaid flowchart generator"""
+import re
+
+import pytest
+
+from flowchart import parse_pseudocode, pseudocode_to_mermaid
+
+# Node definitions and edges in the subset of flowchart syntax the generator emits
+NODE_PATTERN = re.compile(r'^    (N\d+)(?:\(\["([^"]*)"\]\)|\["([^"]*)"\]|\[/"([^"]*)"/\]|\{"([^"]*)"\})$')
+EDGE_PATTERN = re.compile(r"^    (N\d+) -->(?:\|([^|\"]+)\|)? (N\d+)$")
+
+def assert_valid_mermaid(chart: str):
+    """Check a chart is well-formed flowchart syntax whose edges join defined nodes.
+
+    Also checks that every node but a start can be reached and every node but
+    an end leads somewhere, so a chart can't silently drop part of the logic.
+    """
+    lines = chart.split("\n")
+    assert lines[0] == "flowchart TD"
+
+    nodes, incoming, outgoing, edges = {}, set(), set(), []
+    for line in lines[1:]:
+        node = NODE_PATTERN.match(line)
+        edge = EDGE_PATTERN.match(line)
+        assert node or edge, f"Not valid flowchart syntax: {line!r}"
+        if node:
+            assert node.group(1) not in nodes, f"Node {node.group(1)} defined twice"
+            label = next(group for group in node.groups()[1:] if group is not None)
+            assert label.strip(), f"Node {node.group(1)} has an empty label"
+            assert not re.search(r"[<>`]", label), f"Unescaped character in label {label!r}"
+            nodes[node.group(1)] = (line, label)
+        else:
+            edges.append((edge.group(1), edge.group(3)))
+            outgoing.add(edge.group(1))
+            incoming.add(edge.group(3))
+
+    for source, target in edges:
+        assert source in nodes and target in nodes, f"Edge {source} --> {target} references an undefined node"
+    for node_id, (line, label) in nodes.items():
+        terminal = '(["' in line
+        if not (terminal and node_id not in incoming):
+            assert node_id in incoming, f"Node {node_id} ({label}) is unreachable"
+        if not (terminal and label.startswith("End")):
+            assert node_id in outgoing, f"Node {node_id} ({label}) is a dead end"
+
+CORPUS = {
+    "bubble_sort": """FUNCTION bubbleSort(arr)
+    SET n = length of arr
+    FOR i FROM 0 TO n - 1
+        FOR j FROM 0 TO n - i - 2
+            IF arr[j] > arr[j + 1] THEN
+                SWAP arr[j] and arr[j + 1]
+            END IF
+        END FOR
+    END FOR
+    RETURN arr
+END FUNCTION""",
+    "binary_search_no_end_markers": """FUNCTION binarySearch(arr, target):
+    low = 0
+    high = length(arr) - 1
+    WHILE low <= high:
+        mid = (low + high) / 2
+        IF arr[mid] == target:
+            RETURN mid
+        ELSE IF arr[mid] < target:
+            low = mid + 1
+        ELSE:
+            high = mid - 1
+    RETURN -1""",
+    "flat_with_end_markers": """BEGIN
+INPUT number
+IF number MOD 2 = 0 THEN
+PRINT "even"
+ELSE
+PRINT "odd"
+ENDIF
+END""",
+    "fenced_with_prose_and_other_fences": """Here is the pseudocode for the algorithm:
+
+```
+ALGORITHM Factorial
+    INPUT n
+    SET result = 1
+    FOR i = 2 TO n DO
+        result = result * i
+    NEXT i
+    OUTPUT result
+END ALGORITHM
+```
+
+```python
+def factorial(n):
+    return 1
+```""",
+    "repeat_until": """SET attempts = 0
+REPEAT
+    INPUT guess
+    attempts = attempts + 1
+UNTIL guess == secret
+PRINT "Found in " + attempts + " attempts\"""",
+    "do_while_with_break_and_continue": """DO
+    READ line
+    IF line is empty THEN
+        CONTINUE
+    END IF
+    IF line == "quit" THEN
+        BREAK
+    END IF
+    PRINT line
+WHILE more input""",
+    "numbered_markdown_steps": """**Pseudocode:**
+1. FUNCTION isPrime(n)
+2.     IF n < 2 THEN
+3.         RETURN false
+4.     FOR i FROM 2 TO sqrt(n)
+5.         IF n % i == 0 THEN
+6.             RETURN false
+7.     RETURN true""",
+    "bubble_sort_with_header": """**Algorithm: Bubble Sort**
+
+**Input:** An array `arr` of n comparable elements
+**Output:** `arr` sorted in ascending order
+
+FUNCTION bubbleSort(arr)
+    SET n = length of arr
+    FOR i FROM 0 TO n - 2
+        FOR j FROM 0 TO n - i - 2
+            IF arr[j] > arr[j + 1] THEN
+                SWAP arr[j] AND arr[j + 1]
+    RETURN arr
+
+**Time Complexity:** O(n^2) comparisons""",
+    "several_functions_and_main": """FUNCTION gcd(a, b)
+    WHILE b != 0
+        SET temp = b
+        SET b = a MOD b
+        SET a = temp
+    RETURN a
+
+FUNCTION lcm(a, b)
+    RETURN (a * b) / gcd(a, b)
+
+INPUT x, y
+PRINT "LCM: " + lcm(x, y)""",
+    "for_each_with_nested_elif_chain": """FOR EACH score IN scores
+    IF score >= 90 THEN
+        grade = "A"
+    ELSE IF score >= 80 THEN
+        grade = "B"
+    ELSE IF score >= 70 THEN
+        grade = "C"
+    ELSE
+        grade = "F"
+    END IF
+    PRINT score, grade
+END FOR""",
+    "c_style_braces": """function fizzBuzz(n) {
+    for i = 1 to n {
+        if i % 15 == 0 {
+            print "FizzBuzz"
+        }
+        else {
+            print i
+        }
+    }
+}""",
+    "special_characters_in_labels": """IF text contains "<script>" AND count # 3 THEN
+    RETURN `escaped`
+END IF""",
+}
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+def test_corpus_produces_valid_mermaid(name):
+    chart = pseudocode_to_mermaid(CORPUS[name])
+    assert chart is not None, f"{name} should parse"
+    assert_valid_mermaid(chart)
+
+def test_bubble_sort_structure():
+    chart = pseudocode_to_mermaid(CORPUS["bubble_sort"])
+    assert '(["bubbleSort(arr)"])' in chart
+    assert '{"FOR j FROM 0 TO n - i - 2"}' in chart
+    assert '{"arr[j] #gt; arr[j + 1]"}' in chart
+    # Both loops feed back into their own decision
+    assert chart.count("-->|Done|") == 2
+    assert chart.count("-->|Next|") == 2
+
+def test_header_lines_are_not_a_separate_main_flow():
+    chart = pseudocode_to_mermaid(CORPUS["bubble_sort_with_header"])
+    assert '(["bubbleSort(arr)"])' in chart
+    assert '(["Start"])' not in chart
+    assert "Input" not in chart and "Complexity" not in chart
+
+def test_return_leaves_the_function():
+    chart = pseudocode_to_mermaid(CORPUS["binary_search_no_end_markers"])
+    return_node = re.search(r'(N\d+)\["RETURN mid"\]', chart).group(1)
+    end_node = re.search(r'(N\d+)\(\["End binarySearch"\]\)', chart).group(1)
+    assert re.findall(rf"^    {return_node} --> (N\d+)$", chart, re.MULTILINE) == [end_node]
+
+def test_if_with_else_if_chain_has_one_decision_per_condition():
+    chart = pseudocode_to_mermaid(CORPUS["for_each_with_nested_elif_chain"])
+    decisions = [line for line in chart.split("\n") if '{"' in line]
+    assert len(decisions) == 4  # the loop plus three conditions
+    assert 'grade = #quot;F#quot;' in chart
+
+def test_repeat_until_loops_back_on_no():
+    blocks = parse_pseudocode(CORPUS["repeat_until"])
+    assert [block.kind for block in blocks] == ["statement", "repeat", "io"]
+    assert blocks[1].text == "guess == secret"
+    chart = pseudocode_to_mermaid(CORPUS["repeat_until"])
+    assert '{"until guess == secret"}' in chart
+    assert re.search(r"N\d+ -->\|No\| N3$", chart, re.MULTILINE)
+
+def test_indented_and_end_marker_styles_parse_alike():
+    indented = """IF x > 0 THEN
+    PRINT "positive"
+ELSE
+    PRINT "not positive"
+PRINT "done\""""
+    marked = """IF x > 0 THEN
+PRINT "positive"
+ELSE
+PRINT "not positive"
+END IF
+PRINT "done\""""
+    assert pseudocode_to_mermaid(indented) == pseudocode_to_mermaid(marked)
+
+def test_several_functions_get_their_own_start_and_end():
+    chart = pseudocode_to_mermaid(CORPUS["several_functions_and_main"])
+    for terminal in ('(["gcd(a, b)"])', '(["End gcd"])', '(["lcm(a, b)"])', '(["End lcm"])', '(["Start"])', '(["End"])'):
+        assert terminal in chart
+
+def test_lowercase_do_in_a_condition_is_not_a_body():
+    chart = pseudocode_to_mermaid("WHILE tasks left to do remain\n    PRINT task")
+    assert '{"tasks left to do remain"}' in chart
+
+def test_long_labels_are_truncated():
+    chart = pseudocode_to_mermaid("SET total = " + " + ".join(f"value{index}" for index in range(40)))
+    label = re.search(r'N2\["([^"]*)"\]', chart).group(1)
+    assert len(label) <= 80 and label.endswith("...")
+
+@pytest.mark.parametrize("pseudocode", [
+    "",
+    "```python\n```",
+    "ELSE\n    PRINT x",
+    "UNTIL done",
+    "SET x = 1\n        SET y = 2",
+    "SWITCH color\n    CASE red:\n        PRINT 1",
+    "BREAK",
+    "REPEAT\n    PRINT x",
+    # One-line bodies aren't split out of the condition
+    "IF x < 0 THEN RETURN 0\nPRINT x",
+    "WHILE x > 0 DO x = x - 1",
+    "IF x > 0 THEN\n    PRINT x\nELSE IF x < 0 THEN PRINT -x",
+    # A flat block with no END would swallow the rest of the program
+    "IF x > 0 THEN\nPRINT x\nPRINT y",
+    "WHILE x > 0\nx = x - 1\nPRINT x",
+    # Prose next to a function would become a disconnected main flow
+    "FUNCTION double(x)\n    RETURN x * 2\nThis returns twice its input.",
+])
+def test_unparseable_pseudocode_falls_back(pseudocode):
+    assert pseudocode_to_mermaid(pseudocode) is None
@@ -0,0 +1,181 @@
+"""Tests for the MongoDB-backed job queue"""
+import asyncio
+from datetime import datetime, timedelta
+
+from jobs import JobQueue
+
+def retry_after(seconds):
+    """A retry policy that always retries after `seconds`, or never when None"""
+    return lambda error, attempts: (seconds, str(error))
+
+async def never_called(request):
+    raise AssertionError("execute should not run")
+
+def make_queue(collection, execute=never_called, retry_policy=retry_after(None), visibility_timeout=60.0, max_attempts=3):
+    return JobQueue(collection, execute, retry_policy, 1, visibility_timeout, max_attempts, 3600, 0.01)
+
+async def wait_for_status(collection, job_id, status, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await collection.find_one({"_id": job_id})
+        if job["status"] == status or asyncio.get_running_loop().time() > deadline:
+            return job
+        await asyncio.sleep(0.01)
+
+def test_claim_leases_the_oldest_available_job(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection)
+        first = await queue.enqueue({"content": "first"})
+        await asyncio.sleep(0.01)
+        second = await queue.enqueue({"content": "second"})
+
+        claimed = await queue.claim()
+        assert claimed["_id"] == first["_id"]
+        assert (claimed["status"], claimed["attempts"], claimed["lease_owner"]) == ("running", 1, queue.owner)
+        assert claimed["available_at"] > datetime.utcnow() + timedelta(seconds=50)
+
+        assert (await queue.claim())["_id"] == second["_id"]
+        assert await queue.claim() is None
+
+    asyncio.run(scenario())
+
+def test_expired_lease_lets_another_worker_take_the_job(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        crashed = make_queue(collection, visibility_timeout=0.05)
+        job = await crashed.enqueue({"content": "x"})
+        await crashed.claim()
+
+        other = make_queue(collection)
+        assert await other.claim() is None
+        await asyncio.sleep(0.1)
+        reclaimed = await other.claim()
+        assert (reclaimed["_id"], reclaimed["attempts"], reclaimed["lease_owner"]) == (job["_id"], 2, other.owner)
+        # The first worker no longer holds the lease, so its late update is dropped
+        assert not await crashed.update_leased(job["_id"], crashed.finished("succeeded", result_id="stale"))
+        assert (await collection.find_one({"_id": job["_id"]}))["status"] == "running"
+
+    asyncio.run(scenario())
+
+def test_job_whose_lease_expired_too_often_fails(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection, max_attempts=1)
+        job = await queue.enqueue({"content": "x"})
+        await collection.update_one({"_id": job["_id"]}, {"$set": {"attempts": 1}})
+
+        await queue.run_job(await queue.claim())
+        stored = await collection.find_one({"_id": job["_id"]})
+        assert (stored["status"], stored["error"]) == ("failed", "Job lease expired too many times")
+
+    asyncio.run(scenario())
+
+def test_failed_job_is_retried_after_backoff_then_fails(mongo_collection):
+    calls = []
+
+    async def flaky(request):
+        calls.append(request)
+        raise RuntimeError("Gemini unavailable")
+
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection, execute=flaky, retry_policy=retry_after(30), max_attempts=2)
+        job = await queue.enqueue({"content": "x"})
+
+        before = datetime.utcnow()
+        await queue.run_job(await queue.claim())
+        stored = await collection.find_one({"_id": job["_id"]})
+        assert (stored["status"], stored["lease_owner"], stored["error"]) == ("queued", None, "Gemini unavailable")
+        assert before + timedelta(seconds=29) <= stored["available_at"] <= datetime.utcnow() + timedelta(seconds=31)
+        # Not claimable until the backoff has passed
+        assert await queue.claim() is None
+
+        await collection.update_one({"_id": job["_id"]}, {"$set": {"available_at": datetime.utcnow()}})
+        await queue.run_job(await queue.claim())
+        stored = await collection.find_one({"_id": job["_id"]})
+        assert (stored["status"], stored["attempts"], stored["error"]) == ("failed", 2, "Gemini unavailable")
+        assert stored["expires_at"] > datetime.utcnow()
+        assert len(calls) == 2
+        assert (queue.counters["retried"], queue.counters["failed"]) == (1, 1)
+
+    asyncio.run(scenario())
+
+def test_error_the_policy_wont_retry_fails_at_once(mongo_collection):
+    async def rejected(request):
+        raise ValueError("Unsupported language")
+
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection, execute=rejected)
+        job = await queue.enqueue({"content": "x"})
+        await queue.run_job(await queue.claim())
+        stored = await collection.find_one({"_id": job["_id"]})
+        assert (stored["status"], stored["attempts"], stored["error"]) == ("failed", 1, "Unsupported language")
+
+    asyncio.run(scenario())
+
+def test_workers_run_queued_jobs(mongo_collection):
+    async def execute(request):
+        return f"result-{request['content']}"
+
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection, execute=execute)
+        queue.start()
+        job = await queue.enqueue({"content": "x"})
+        stored = await wait_for_status(collection, job["_id"], "succeeded")
+        await queue.stop(drain_timeout=1)
+        assert (stored["status"], stored["result_id"], stored["lease_owner"]) == ("succeeded", "result-x", None)
+
+    asyncio.run(scenario())
+
+def test_drain_releases_jobs_still_running(mongo_collection):
+    started = []
+
+    async def hang(request):
+        started.append(request)
+        await asyncio.Event().wait()
+
+    async def scenario():
+        collection = mongo_collection()
+        queue = make_queue(collection, execute=hang)
+        queue.start()
+        job = await queue.enqueue({"content": "x"})
+        await wait_for_status(collection, job["_id"], "running")
+        while not started:
+            await asyncio.sleep(0.01)
+
+        await queue.stop(drain_timeout=0.05)
+        stored = await collection.find_one({"_id": job["_id"]})
+        # Handed back without counting the interrupted attempt
+        assert (stored["status"], stored["attempts"], stored["lease_owner"]) == ("queued", 0, None)
+        assert stored["available_at"] <= datetime.utcnow()
+        assert queue.counters["released"] == 1
+        assert queue.worker_tasks == [] and queue.running == {}
+
+    asyncio.run(scenario())
+
+def test_drain_waits_for_jobs_that_finish_in_time(mongo_collection):
+    async def scenario():
+        finish = asyncio.Event()
+
+        async def slow(request):
+            await finish.wait()
+            return "result"
+
+        collection = mongo_collection()
+        queue = make_queue(collection, execute=slow)
+        queue.start()
+        job = await queue.enqueue({"content": "x"})
+        await wait_for_status(collection, job["_id"], "running")
+
+        stopping = asyncio.create_task(queue.stop(drain_timeout=2))
+        await asyncio.sleep(0.05)
+        finish.set()
+        await stopping
+        stored = await collection.find_one({"_id": job["_id"]})
+        assert (stored["status"], stored["result_id"]) == ("succeeded", "result")
+        assert queue.counters["released"] == 0
+
+    asyncio.run(scenario())
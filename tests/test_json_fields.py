@@ -0,0 +1,66 @@
+"""Tests for parsing and validating JSON-mode answers"""
+import asyncio
+import json
+
+import pytest
+
+from json_fields import ANALYSIS_FIELDS, extract_json, request_json_fields
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here you go:\n{"a": 1}\nHope that helps', {"a": 1}),
+    ('see [1] {"a": 1}', {"a": 1}),
+    ('Notes {like this} then ```\n[1, 2]\n```', [1, 2]),
+    ('a [broken { start then {"a": [1]}', {"a": [1]}),
+])
+def test_extract_json(text, expected):
+    assert extract_json(text) == expected
+
+def test_extract_json_without_json_raises():
+    with pytest.raises(ValueError):
+        extract_json("no json [here] {either")
+
+ANALYSIS = {
+    "time_complexity": "O(n)",
+    "space_complexity": "O(1)",
+    "quality_score": 8,
+    "optimizations": ["Use a set"],
+    "alternatives": ["Sort first"],
+    "learning_insights": ["Hashing is O(1) on average"],
+}
+
+def scripted(*replies):
+    """A call() that returns (or raises) the given replies in order and records what was asked"""
+    requests = []
+
+    async def call(prompt, schema):
+        requests.append((prompt, schema))
+        reply = replies[len(requests) - 1]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    return call, requests
+
+def test_complete_answer_needs_one_call():
+    call, requests = scripted(json.dumps(ANALYSIS))
+    assert asyncio.run(request_json_fields(call, "prompt", ANALYSIS_FIELDS, "test")) == ANALYSIS
+    assert len(requests) == 1
+
+def test_invalid_fields_are_asked_for_again_on_their_own():
+    first = {**ANALYSIS, "quality_score": 42, "alternatives": []}
+    call, requests = scripted(json.dumps(first), json.dumps({"quality_score": 6, "alternatives": ["Recursion"]}))
+    result = asyncio.run(request_json_fields(call, "prompt", ANALYSIS_FIELDS, "test"))
+    assert result == {**ANALYSIS, "quality_score": 6, "alternatives": ["Recursion"]}
+    assert requests[1][1]["required"] == ["quality_score", "alternatives"]
+
+def test_failed_retry_keeps_fields_that_already_validated():
+    first = {key: value for key, value in ANALYSIS.items() if key != "learning_insights"}
+    call, _ = scripted(json.dumps(first), RuntimeError("Gemini unavailable"))
+    assert asyncio.run(request_json_fields(call, "prompt", ANALYSIS_FIELDS, "test")) == first
+
+def test_failed_first_call_raises():
+    call, _ = scripted(RuntimeError("Gemini unavailable"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(request_json_fields(call, "prompt", ANALYSIS_FIELDS, "test"))
@@ -0,0 +1,82 @@
+"""Tests for the write-behind profile store"""
+import asyncio
+from datetime import datetime
+from typing import List
+
+import pytest
+
+from profile_store import ProfileStore
+
+pydantic = pytest.importorskip("pydantic")
+
+class Profile(pydantic.BaseModel):
+    session_id: str
+    skill_level: str = "beginner"
+    interaction_history: List[dict] = pydantic.Field(default_factory=list)
+    interaction_count: int = 0
+    last_updated: datetime = pydantic.Field(default_factory=datetime.utcnow)
+
+def make_store(collection):
+    return ProfileStore(collection, Profile, 16, 60, 60, 3)
+
+def test_queued_updates_are_visible_before_and_after_the_flush(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        store = make_store(collection)
+        assert (await store.get("s1")).skill_level == "beginner"
+        store.update_fields("s1", {"skill_level": "advanced"})
+        for number in range(5):
+            store.record_interaction("s1", {"number": number})
+        assert (await store.get("s1")).interaction_count == 5
+        assert await collection.count_documents({"skill_level": "advanced"}) == 0
+
+        await store.flush()
+        stored = await collection.find_one({"session_id": "s1"})
+        assert (stored["skill_level"], stored["interaction_count"]) == ("advanced", 5)
+        # Only the newest history_limit interactions are kept
+        assert [item["number"] for item in stored["interaction_history"]] == [2, 3, 4]
+        reloaded = await make_store(collection).get("s1")
+        assert (reloaded.skill_level, reloaded.interaction_count, reloaded.interaction_history) == ("advanced", 5, [])
+
+    asyncio.run(scenario())
+
+def test_failed_updates_are_requeued_ahead_of_newer_ones(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        # A unique index makes one session's update fail inside the unordered bulk write
+        await collection.create_index("skill_level", unique=True)
+        await collection.insert_one({"session_id": "other", "skill_level": "expert"})
+        store = make_store(collection)
+        store.record_interaction("broken", {"number": 1})
+        store.update_fields("broken", {"skill_level": "expert"})
+        store.update_fields("fine", {"skill_level": "advanced"})
+
+        flushing = asyncio.create_task(store.flush())
+        await asyncio.sleep(0)
+        store.record_interaction("broken", {"number": 2})
+        store.update_fields("broken", {"skill_level": "intermediate"})
+        await flushing
+
+        assert (await collection.find_one({"session_id": "fine"}))["skill_level"] == "advanced"
+        assert store.counters["flush_errors"] == 1
+        assert list(store.pending) == ["broken"]
+        assert store.pending["broken"] == {
+            "set": {"skill_level": "intermediate"},
+            "inc": {"interaction_count": 2},
+            "push": [{"number": 1}, {"number": 2}]
+        }
+        assert store.flushing == {}
+
+    asyncio.run(scenario())
+
+def test_stop_writes_what_is_still_queued(mongo_collection):
+    async def scenario():
+        collection = mongo_collection()
+        store = make_store(collection)
+        store.start()
+        store.update_fields("s1", {"skill_level": "advanced"})
+        await store.stop()
+        assert (await collection.find_one({"session_id": "s1"}))["skill_level"] == "advanced"
+        assert store.pending == {} and store.flush_task is None
+
+    asyncio.run(scenario())
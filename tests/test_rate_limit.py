@@ -0,0 +1,74 @@
+"""Tests for the process-wide Gemini rate limiter"""
+import asyncio
+import time
+
+import pytest
+
+from rate_limit import GeminiRateLimiter, QuotaExceeded
+
+async def timed_acquire(limiter, tokens=1):
+    started = time.monotonic()
+    try:
+        await limiter.acquire(tokens)
+    except QuotaExceeded:
+        return None
+    return time.monotonic() - started
+
+def test_concurrent_callers_never_wait_past_the_limit():
+    limiter = GeminiRateLimiter(600, 10_000_000, max_wait_seconds=0.5)
+
+    async def burst():
+        return await asyncio.gather(*(timed_acquire(limiter) for _ in range(650)))
+
+    waits = asyncio.run(burst())
+    served = [wait for wait in waits if wait is not None]
+    # A full bucket serves 600 at once, then one every 0.1s for the next half second
+    assert 600 <= len(served) <= 606
+    assert limiter.counters["rejected"] == 650 - len(served)
+    assert max(served) <= 0.5 + 0.1
+
+def test_rejection_is_immediate_and_reports_retry_after():
+    limiter = GeminiRateLimiter(60, 10_000_000, max_wait_seconds=0.5)
+    limiter.requests.level = 0
+
+    async def attempt():
+        started = time.monotonic()
+        with pytest.raises(QuotaExceeded) as excinfo:
+            await limiter.acquire(1)
+        return time.monotonic() - started, excinfo.value
+
+    elapsed, error = asyncio.run(attempt())
+    assert elapsed < 0.05
+    assert error.retry_after == pytest.approx(1.0, abs=0.05)
+
+def test_token_budget_is_charged_and_reconciled():
+    limiter = GeminiRateLimiter(60, 6000, max_wait_seconds=0)
+    asyncio.run(limiter.acquire(1000))
+    assert limiter.tokens.level == pytest.approx(5000, abs=1)
+
+    class Usage:
+        total_token_count = 1500
+
+    class Response:
+        usage_metadata = Usage()
+
+    limiter.reconcile(1000, Response())
+    assert limiter.tokens.level == pytest.approx(4500, abs=1)
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(limiter.acquire(5000))
+
+def test_cancelled_caller_returns_its_reservation():
+    limiter = GeminiRateLimiter(60, 10_000_000, max_wait_seconds=5)
+    limiter.requests.level = 0
+
+    async def cancel_waiter():
+        waiter = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(cancel_waiter())
+    limiter.requests.refill()
+    assert limiter.requests.level > -0.1
+    assert limiter.counters["acquired"] == 0
@@ -0,0 +1,152 @@
+"""Tests for the local ast-based code analyzer"""
+import pytest
+
+from static_analysis import analyze_python_statically
+
+CASES = {
+    "constant": ("""def first(items):
+    return items[0]
+""", "O(1)", "O(1)"),
+    "single_loop": ("""def total(items):
+    result = 0
+    for item in items:
+        result += item
+    return result
+""", "O(n)", "O(1)"),
+    "nested_loops": ("""def pairs(items):
+    found = []
+    for a in items:
+        for b in items:
+            if a + b == 0:
+                found.append((a, b))
+    return found
+""", "O(n^2)", "O(n)"),
+    "naive_recursion": ("""def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+""", "O(2^n)", "O(n)"),
+    "memoized_recursion": ("""from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+""", "O(n)", "O(n)"),
+    "linear_recursion": ("""def factorial(n):
+    return 1 if n <= 1 else n * factorial(n - 1)
+""", "O(n)", "O(n)"),
+    "iterative_binary_search": ("""def search(arr, target):
+    low, high = 0, len(arr) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        if arr[mid] == target:
+            return mid
+        if arr[mid] < target:
+            low = mid + 1
+        else:
+            high = mid - 1
+    return -1
+""", "O(log n)", "O(1)"),
+    "linear_loop_with_division": ("""def averages(values):
+    i, n = 0, len(values)
+    while i < n // 2:
+        i += 1
+        avg = i / 2
+        mid = (i + n) // 2
+    return avg
+""", "O(n)", "O(1)"),
+    "halving_bits": ("""def bit_count(n):
+    count = 0
+    while n > 0:
+        count += n & 1
+        n >>= 1
+    return count
+""", "O(log n)", "O(1)"),
+    "linear_recursion_with_average": ("""def walk(values, index, total):
+    if index == len(values):
+        return total / 2
+    midpoint = (index + len(values)) // 2
+    return walk(values, index + 1, total + values[index])
+""", "O(n)", "O(n)"),
+    "recursive_binary_search": ("""def search(arr, target, low, high):
+    if low > high:
+        return -1
+    mid = (low + high) // 2
+    if arr[mid] == target:
+        return mid
+    if arr[mid] < target:
+        return search(arr, target, mid + 1, high)
+    return search(arr, target, low, mid - 1)
+""", "O(log n)", "O(log n)"),
+    "merge_sort": ("""def merge_sort(arr):
+    if len(arr) <= 1:
+        return arr
+    mid = len(arr) // 2
+    left, right = merge_sort(arr[:mid]), merge_sort(arr[mid:])
+    return merge(left, right)
+""", "O(n log n)", "O(log n)"),
+    "sorted_call": ("""def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+""", "O(n log n)", "O(1)"),
+    "sort_in_loop": ("""def running_medians(values):
+    for index in range(len(values)):
+        window = values[:index + 1]
+        window.sort()
+""", "O(n^2 log n)", "O(1)"),
+    "in_list_inside_loop": ("""def unique(items):
+    seen = []
+    for item in items:
+        if item not in seen:
+            seen.append(item)
+    return seen
+""", "O(n^2)", "O(n)"),
+    "in_set_inside_loop": ("""def unique(items):
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+    return seen
+""", "O(n)", "O(n)"),
+    "sum_inside_loop": ("""def prefix_totals(values):
+    return [sum(values[:index]) for index in range(len(values))]
+""", "O(n^2)", "O(n)"),
+    "generator_argument_is_one_pass": ("""def total_even(values):
+    return sum(value for value in values if value % 2 == 0)
+""", "O(n)", "O(n)"),
+    "in_literal_is_constant": ("""def count_vowels(text):
+    count = 0
+    for char in text:
+        if char in ["a", "e", "i", "o", "u"]:
+            count += 1
+    return count
+""", "O(n)", "O(1)"),
+}
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_complexity_estimates(name):
+    code, time_complexity, space_complexity = CASES[name]
+    analysis = analyze_python_statically(code)
+    assert (analysis["time_complexity"], analysis["space_complexity"]) == (time_complexity, space_complexity)
+
+def test_costly_call_in_loop_is_flagged():
+    analysis = analyze_python_statically(CASES["in_list_inside_loop"][0])
+    assert any("`in` on a list inside a loop in unique" in suggestion for suggestion in analysis["optimizations"])
+
+def test_naive_recursion_suggests_memoizing():
+    analysis = analyze_python_statically(CASES["naive_recursion"][0])
+    assert any("lru_cache" in suggestion for suggestion in analysis["optimizations"])
+    assert analysis["static_analysis"]["functions"] == [
+        {"name": "fib", "lines": 4, "cyclomatic_complexity": 2, "max_loop_depth": 0, "recursive": True}
+    ]
+
+def test_branchy_function_loses_quality_points():
+    branches = "\n".join(f"    if x == {value}:\n        return {value}" for value in range(12))
+    analysis = analyze_python_statically(f"def classify(x):\n{branches}\n    return -1\n")
+    assert analysis["quality_score"] == 8
+    assert any("cyclomatic complexity 13" in suggestion for suggestion in analysis["optimizations"])
+
+def test_unparseable_code_returns_none():
+    assert analyze_python_statically("def broken(:\n    pass") is None